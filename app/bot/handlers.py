@@ -1,6 +1,5 @@
 from __future__ import annotations
 
-import asyncio
 import logging
 from dataclasses import dataclass
 
@@ -8,7 +7,7 @@ from aiogram import Bot, F, Router
 from aiogram.exceptions import TelegramBadRequest
 from aiogram.filters import Command
 from aiogram.fsm.context import FSMContext
-from aiogram.types import CallbackQuery, Message
+from aiogram.types import CallbackQuery, Message, PhotoSize
 
 from app.bot.keyboards import (
     balance_actions_keyboard,
@@ -24,11 +23,25 @@ from app.config import Settings
 from app.repositories.payments import PaymentRepo
 from app.repositories.users import UserRepo
 from app.services.balance_service import BalanceService
-from app.services.generation_service import GenerationService
+from app.services.generation_service import (
+    GenerationBusyError,
+    GenerationJob,
+    GenerationService,
+    InputPhoto,
+)
+from app.services.kie_task_poller import KieTaskPoller
+from app.services.payment_service import PAYMENT_SUCCESS_TEXT, PaymentService
 from app.services.referral_service import ReferralService
 from app.services.yookassa_service import YooKassaService
 
 
+GENERATION_STATUS_TEXT = (
+    "⏳ Создаю образ…\n"
+    "Это может занять до 1 минуты.\n"
+    "Я стараюсь получить максимально качественный результат ✨"
+)
+
+
 @dataclass(slots=True)
 class AppContext:
     settings: Settings
@@ -38,6 +51,9 @@ class AppContext:
     referral_service: ReferralService
     generation_service: GenerationService
     yookassa_service: YooKassaService
+    payment_service: PaymentService
+    kie_task_poller: KieTaskPoller
+    bot_username: str = ""
 
 
 def build_router() -> Router:
@@ -51,9 +67,8 @@ def build_router() -> Router:
         args = (message.text or "").split()
         referrer_id = _parse_referrer(args[1] if len(args) > 1 else "")
 
-        user = await ctx.user_repo.get_user(user_id)
-        if user is None:
-            await ctx.user_repo.create_user(user_id, referrer_id, bonus_generations=1)
+        created = await ctx.balance_service.ensure_user(user_id, referrer_id, bonus_generations=1)
+        if created:
             if referrer_id and referrer_id != user_id:
                 await _try_grant_referral_bonus(message.bot, ctx, user_id, referrer_id)
         await message.answer(
@@ -94,8 +109,7 @@ def build_router() -> Router:
         ctx: AppContext = message.bot.ctx
         data = await state.get_data()
         photos = list(data.get("photos", []))
-        photo = message.photo[-1]
-        photos.append(photo.file_id)
+        photos.append(_photo_state(message.photo[-1]))
         if len(photos) > 2:
             await state.clear()
             await message.answer("Можно загрузить только 1 или 2 фотографии. Начни заново 🙌")
@@ -139,7 +153,7 @@ def build_router() -> Router:
         if len(photos) >= 2:
             await message.answer("Уже получил 2 фото. Теперь промпт ✍️")
             return
-        photos.append(message.photo[-1].file_id)
+        photos.append(_photo_state(message.photo[-1]))
         await state.update_data(photos=photos)
         await message.answer("Фото добавлено ✅ Теперь промпт ✍️")
 
@@ -224,9 +238,9 @@ def build_router() -> Router:
     @router.callback_query(F.data == "menu:referral")
     async def menu_referral(callback: CallbackQuery) -> None:
         await callback.answer()
-        bot_username = (await callback.bot.get_me()).username
-        ref_link = f"https://t.me/{bot_username}?start=ref_{callback.from_user.id}"
-        invited_count = await callback.bot.ctx.user_repo.count_referrals(callback.from_user.id)
+        ctx: AppContext = callback.bot.ctx
+        ref_link = f"https://t.me/{ctx.bot_username}?start=ref_{callback.from_user.id}"
+        invited_count = await ctx.user_repo.count_referrals(callback.from_user.id)
         earned_generations = invited_count * 2
         share_text = (
             "Попробуй бота для генерации фото 🤖\n"
@@ -287,6 +301,22 @@ def build_router() -> Router:
             callback.from_user.id,
         )
 
+    @router.callback_query(F.data.startswith("result:original:"))
+    async def result_original(callback: CallbackQuery) -> None:
+        ctx: AppContext = callback.bot.ctx
+        await callback.answer("Отправляю оригинал…")
+        raw_job_id = callback.data.split("result:original:", 1)[1]
+        sent = False
+        if raw_job_id.isdigit():
+            try:
+                sent = await ctx.generation_service.send_original(
+                    callback.bot, callback.message.chat.id, callback.from_user.id, int(raw_job_id)
+                )
+            except Exception:
+                logging.exception("failed to send original job=%s", raw_job_id)
+        if not sent:
+            await callback.message.answer("Оригинал больше недоступен 😕")
+
     @router.callback_query()
     async def unknown_callback(callback: CallbackQuery) -> None:
         await callback.answer("Кнопка не распознана. Попробуйте ещё раз.", show_alert=False)
@@ -302,6 +332,16 @@ def _parse_referrer(arg: str) -> int | None:
     return None
 
 
+def _photo_state(photo: PhotoSize) -> dict:
+    return {"file_id": photo.file_id, "file_unique_id": photo.file_unique_id}
+
+
+def _input_photo(item: dict | str) -> InputPhoto:
+    if isinstance(item, str):
+        return InputPhoto(file_id=item)
+    return InputPhoto(file_id=item["file_id"], file_unique_id=item.get("file_unique_id"))
+
+
 async def _try_grant_referral_bonus(
     bot: Bot, ctx: AppContext, new_user_id: int, referrer_id: int
 ) -> None:
@@ -317,7 +357,7 @@ async def _start_generation(
     message: Message,
     ctx: AppContext,
     prompt: str,
-    photos: list[str],
+    photos: list[dict | str],
 ) -> None:
     prompt = prompt.strip()
     if not prompt:
@@ -326,29 +366,51 @@ async def _start_generation(
     if len(photos) not in {1, 2}:
         await message.answer("Нужно отправить 1 или 2 фотографии 📸")
         return
-    balance_value = await ctx.balance_service.get_balance(message.from_user.id)
-    if balance_value <= 0:
+    if await ctx.generation_service.is_busy(message.from_user.id):
+        await message.answer("⏳ Генерация уже запущена. Дождитесь результата.")
+        return
+    if not await ctx.balance_service.reserve_generation(message.from_user.id):
         await message.answer(
             "Генерации закончились ✨\n"
             "Ты можешь купить новый пакет и продолжить.",
             reply_markup=buy_now_button(),
         )
         return
-    status_message = await message.answer(
-        "⏳ Создаю образ…\n"
-        "Это может занять до 1 минуты.\n"
-        "Я стараюсь получить максимально качественный результат ✨"
+    # Sent before enqueueing so that a fast worker always finds the message to clean up.
+    status_message = await message.answer(GENERATION_STATUS_TEXT)
+    job = GenerationJob(
+        bot=message.bot,
+        user_id=message.from_user.id,
+        chat_id=message.chat.id,
+        prompt=prompt,
+        photos=[_input_photo(item) for item in photos],
+        status_message_id=status_message.message_id,
     )
-    asyncio.create_task(
-        ctx.generation_service.generate(
-            bot=message.bot,
-            user_id=message.from_user.id,
-            chat_id=message.chat.id,
-            prompt=prompt,
-            photo_file_ids=photos,
-            status_message_id=status_message.message_id,
+    try:
+        position = await ctx.generation_service.enqueue(job)
+    except GenerationBusyError:
+        await ctx.balance_service.release_generation(job.user_id)
+        await _edit_message(status_message, "⏳ Генерация уже запущена. Дождитесь результата.")
+        return
+    except Exception:
+        await ctx.balance_service.release_generation(job.user_id)
+        await _edit_message(status_message, "⚠️ Ошибка генерации. Попробуйте ещё раз позже.")
+        raise
+    if position is None:
+        await ctx.balance_service.release_generation(job.user_id)
+        await _edit_message(
+            status_message,
+            "Сейчас очень много желающих 🙏\n"
+            "Попробуй отправить запрос ещё раз через пару минут.",
         )
-    )
+        return
+    if position:
+        try:
+            await status_message.edit_text(
+                f"{GENERATION_STATUS_TEXT}\n🕐 Ты в очереди: {position}"
+            )
+        except TelegramBadRequest:
+            logging.info("status message already gone job=%s", job.job_id)
 
 
 async def _create_payment(message: Message, user_id: int, count: int) -> None:
@@ -427,25 +489,16 @@ async def _check_payment_status(message: Message, payment_id: str, user_id: int)
         await message.answer("Не удалось проверить оплату. Попробуйте позже.")
         return
     status = payment.get("status") or payment_record.get("status") or "pending"
+    credited = await ctx.payment_service.apply_status(payment_record, status)
     if status == "succeeded":
-        updated = await ctx.payment_repo.mark_succeeded(payment_id)
-        if updated:
-            generations = int(payment_record["generations"])
-            await ctx.balance_service.add_generations(user_id, generations)
-            await message.answer(
-                "Оплата прошла успешно\n\n"
-                "Генерации уже доступны.\n"
-                "Можем продолжать создавать образы."
-            )
+        if credited:
+            await message.answer(PAYMENT_SUCCESS_TEXT)
         else:
             await message.answer("✅ Оплата уже подтверждена. Проверьте баланс.")
         return
     if status in {"canceled", "cancelled"}:
-        await ctx.payment_repo.update_status(payment_id, status)
         await message.answer("❌ Платёж отменён.")
         return
-    if status and status != payment_record.get("status"):
-        await ctx.payment_repo.update_status(payment_id, status)
     await message.answer("⏳ Оплата пока не подтверждена. Попробуйте позже.")
 
 
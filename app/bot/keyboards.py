@@ -76,13 +76,22 @@ def buy_now_button() -> InlineKeyboardMarkup:
     )
 
 
-def result_actions_keyboard() -> InlineKeyboardMarkup:
-    return InlineKeyboardMarkup(
-        inline_keyboard=[
-            [InlineKeyboardButton(text="Сгенерировать ещё", callback_data="menu:generate")],
-            [InlineKeyboardButton(text="Вернуться в меню", callback_data="menu:back")],
-        ]
-    )
+def result_actions_keyboard(original_job_id: int | None = None) -> InlineKeyboardMarkup:
+    rows = [
+        [InlineKeyboardButton(text="Сгенерировать ещё", callback_data="menu:generate")],
+        [InlineKeyboardButton(text="Вернуться в меню", callback_data="menu:back")],
+    ]
+    if original_job_id is not None:
+        rows.insert(
+            1,
+            [
+                InlineKeyboardButton(
+                    text="Оригинал файлом 📎",
+                    callback_data=f"result:original:{original_job_id}",
+                )
+            ],
+        )
+    return InlineKeyboardMarkup(inline_keyboard=rows)
 
 
 def balance_actions_keyboard() -> InlineKeyboardMarkup:
@@ -0,0 +1,181 @@
+from __future__ import annotations
+
+import asyncio
+import json
+import logging
+import time
+import uuid
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator
+
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import (
+    BaseEventIsolation,
+    BaseStorage,
+    DefaultKeyBuilder,
+    StateType,
+    StorageKey,
+)
+from aiogram.fsm.storage.memory import MemoryStorage, SimpleEventIsolation
+
+from app.config import Settings
+from app.db import Database
+
+
+class SQLiteStorage(BaseStorage):
+    def __init__(self, database: Database, ttl_seconds: int) -> None:
+        self._db = database
+        self._ttl_seconds = ttl_seconds
+        self._key_builder = DefaultKeyBuilder(with_bot_id=True, with_destiny=True)
+
+    def _expires_at(self) -> float:
+        return time.time() + self._ttl_seconds
+
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        value = state.state if isinstance(state, State) else state
+        async with self._db.write("fsm.set_state") as db:
+            await db.execute(
+                """
+                INSERT INTO fsm_storage (key, state, data, expires_at)
+                VALUES (?, ?, '{}', ?)
+                ON CONFLICT(key) DO UPDATE SET
+                    state = excluded.state,
+                    data = CASE WHEN fsm_storage.expires_at < ? THEN '{}' ELSE fsm_storage.data END,
+                    expires_at = excluded.expires_at
+                """,
+                (self._key_builder.build(key), value, self._expires_at(), time.time()),
+            )
+
+    async def get_state(self, key: StorageKey) -> str | None:
+        row = await self._get_row(key)
+        return row["state"] if row else None
+
+    async def set_data(self, key: StorageKey, data: dict[str, Any]) -> None:
+        async with self._db.write("fsm.set_data") as db:
+            await db.execute(
+                """
+                INSERT INTO fsm_storage (key, state, data, expires_at)
+                VALUES (?, NULL, ?, ?)
+                ON CONFLICT(key) DO UPDATE SET
+                    state = CASE WHEN fsm_storage.expires_at < ? THEN NULL ELSE fsm_storage.state END,
+                    data = excluded.data,
+                    expires_at = excluded.expires_at
+                """,
+                (
+                    self._key_builder.build(key),
+                    json.dumps(data, ensure_ascii=False),
+                    self._expires_at(),
+                    time.time(),
+                ),
+            )
+
+    async def get_data(self, key: StorageKey) -> dict[str, Any]:
+        row = await self._get_row(key)
+        if not row or not row["data"]:
+            return {}
+        return json.loads(row["data"])
+
+    async def close(self) -> None:
+        pass
+
+    async def purge_expired(self) -> int:
+        async with self._db.write("fsm.purge_expired") as db:
+            cursor = await db.execute(
+                "DELETE FROM fsm_storage WHERE expires_at < ?",
+                (time.time(),),
+            )
+            return cursor.rowcount
+
+    async def run_purge(self, interval_seconds: int) -> None:
+        while True:
+            await asyncio.sleep(interval_seconds)
+            try:
+                purged = await self.purge_expired()
+                if purged:
+                    logging.info("purged expired fsm states count=%s", purged)
+            except Exception:
+                logging.exception("fsm purge failed")
+
+    async def _get_row(self, key: StorageKey) -> dict | None:
+        async with self._db.read("fsm.get_row") as db:
+            async with db.execute(
+                "SELECT state, data FROM fsm_storage WHERE key = ? AND expires_at >= ?",
+                (self._key_builder.build(key), time.time()),
+            ) as cursor:
+                row = await cursor.fetchone()
+            return dict(row) if row else None
+
+
+class SQLiteEventIsolation(BaseEventIsolation):
+    def __init__(
+        self, database: Database, ttl_seconds: float = 60, retry_seconds: float = 0.05
+    ) -> None:
+        self._db = database
+        self._ttl_seconds = ttl_seconds
+        self._retry_seconds = retry_seconds
+        self._key_builder = DefaultKeyBuilder(with_bot_id=True, with_destiny=True)
+
+    @asynccontextmanager
+    async def lock(self, key: StorageKey) -> AsyncIterator[None]:
+        lock_key = self._key_builder.build(key)
+        owner = uuid.uuid4().hex
+        while not await self._acquire(lock_key, owner):
+            await asyncio.sleep(self._retry_seconds)
+        try:
+            yield
+        finally:
+            async with self._db.write("fsm_lock.release") as db:
+                await db.execute(
+                    "DELETE FROM fsm_locks WHERE key = ? AND owner = ?",
+                    (lock_key, owner),
+                )
+
+    async def close(self) -> None:
+        pass
+
+    async def _acquire(self, lock_key: str, owner: str) -> bool:
+        now = time.time()
+        async with self._db.write("fsm_lock.acquire") as db:
+            cursor = await db.execute(
+                """
+                INSERT INTO fsm_locks (key, owner, expires_at)
+                VALUES (?, ?, ?)
+                ON CONFLICT(key) DO UPDATE SET
+                    owner = excluded.owner,
+                    expires_at = excluded.expires_at
+                WHERE fsm_locks.expires_at < ?
+                """,
+                (lock_key, owner, now + self._ttl_seconds, now),
+            )
+            return cursor.rowcount > 0
+
+
+def build_storage(settings: Settings, database: Database) -> BaseStorage:
+    if settings.fsm_storage == "memory":
+        return MemoryStorage()
+    if settings.fsm_storage == "redis":
+        try:
+            from aiogram.fsm.storage.redis import RedisStorage
+        except ImportError as exc:
+            raise RuntimeError("FSM_STORAGE=redis requires the 'redis' package") from exc
+        if not settings.redis_url:
+            raise RuntimeError("REDIS_URL is required when FSM_STORAGE=redis")
+        return RedisStorage.from_url(
+            settings.redis_url,
+            key_builder=DefaultKeyBuilder(with_bot_id=True, with_destiny=True),
+            state_ttl=settings.fsm_state_ttl_seconds,
+            data_ttl=settings.fsm_state_ttl_seconds,
+        )
+    return SQLiteStorage(database, ttl_seconds=settings.fsm_state_ttl_seconds)
+
+
+def build_event_isolation(
+    settings: Settings, database: Database, storage: BaseStorage
+) -> BaseEventIsolation:
+    if settings.fsm_storage == "redis":
+        return storage.create_isolation()
+    multi_worker = settings.bot_mode == "webhook" and settings.web_workers > 1
+    if settings.fsm_storage == "sqlite" and multi_worker:
+        # Updates of one album can land on different workers.
+        return SQLiteEventIsolation(database)
+    return SimpleEventIsolation()
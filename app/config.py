@@ -1,5 +1,6 @@
 from __future__ import annotations
 
+import hashlib
 import os
 from dataclasses import dataclass
 
@@ -20,6 +21,13 @@ def _get_int(name: str, default: int | None = None) -> int:
     return int(value)
 
 
+def _get_bool(name: str, default: bool = False) -> bool:
+    value = os.getenv(name)
+    if value is None or value.strip() == "":
+        return default
+    return value.strip().lower() in {"1", "true", "yes", "on"}
+
+
 def _get_optional_int(name: str) -> int | None:
     value = os.getenv(name)
     if value is None or value.strip() == "":
@@ -30,7 +38,12 @@ def _get_optional_int(name: str) -> int | None:
 @dataclass(slots=True)
 class Settings:
     bot_token: str
+    bot_mode: str
     database_path: str
+    database_readers: int
+    fsm_storage: str
+    fsm_state_ttl_seconds: int
+    redis_url: str | None
     price_per_generation: int
 
     kie_api_key: str
@@ -40,37 +53,153 @@ class Settings:
     kie_resolution: str
     kie_aspect_ratio: str
     kie_output_format: str
+    kie_poll_min_interval_seconds: float
     kie_poll_interval_seconds: int
+    kie_poll_concurrency: int
+    kie_callback_enabled: bool
+    kie_callback_path: str
+    kie_callback_secret: str
+    kie_callback_fallback_poll_seconds: int
+    generation_workers: int
+    generation_queue_size: int
+    generation_lock_ttl_seconds: int
+    balance_cache_ttl_seconds: int
+    balance_cache_max_entries: int
+    result_preview_enabled: bool
+    result_preview_max_side: int
+    result_preview_format: str
+    result_preview_quality: int
+    image_process_workers: int
+    input_preprocess_enabled: bool
+    input_max_side: int
+    input_jpeg_quality: int
+    shutdown_timeout_seconds: int
+    metrics_enabled: bool
+    metrics_path: str
+    metrics_host: str
+    metrics_port: int
     kie_max_poll_seconds: int
+    kie_http_limit: int
+    kie_http_limit_per_host: int
+    kie_http_dns_ttl_seconds: int
+    kie_http_keepalive_seconds: int
+    kie_http_timeout_seconds: int
+    kie_upload_buffer_max_bytes: int
+    kie_upload_cache_ttl_seconds: int
+    kie_upload_cache_max_entries: int
 
     yookassa_shop_id: str
     yookassa_secret_key: str
     yookassa_return_url: str
+    yookassa_api_base_url: str
     yookassa_poll_interval_seconds: int
+    yookassa_poll_concurrency: int
+    yookassa_poll_max_backoff_seconds: int
+    yookassa_request_timeout_seconds: int
+    yookassa_pending_ttl_seconds: int
+    payments_archive_after_days: int
+    yookassa_webhook_enabled: bool
+    yookassa_webhook_path: str
+    yookassa_reconcile_interval_seconds: int
     ideas_channel_url: str | None
     telegram_photo_max_bytes: int | None
 
+    web_host: str
+    web_port: int
+    web_workers: int
+    public_base_url: str | None
+    telegram_webhook_path: str
+    telegram_webhook_secret: str
+
 
 def load_settings() -> Settings:
     load_dotenv()
+    bot_token = _get_env("BOT_TOKEN")
+    bot_mode = os.getenv("BOT_MODE", "polling").strip().lower()
+    if bot_mode not in {"polling", "webhook"}:
+        raise RuntimeError(f"Unsupported BOT_MODE: {bot_mode}")
+    public_base_url = os.getenv("PUBLIC_BASE_URL") or None
+    if bot_mode == "webhook" and not public_base_url:
+        raise RuntimeError("PUBLIC_BASE_URL is required when BOT_MODE=webhook")
+    kie_api_key = _get_env("KIE_API_KEY")
+    kie_callback_enabled = _get_bool("KIE_CALLBACK_ENABLED")
+    if kie_callback_enabled and not public_base_url:
+        raise RuntimeError("PUBLIC_BASE_URL is required when KIE_CALLBACK_ENABLED=true")
+    result_preview_format = os.getenv("RESULT_PREVIEW_FORMAT", "jpeg").strip().lower()
+    if result_preview_format not in {"jpeg", "webp"}:
+        raise RuntimeError(f"Unsupported RESULT_PREVIEW_FORMAT: {result_preview_format}")
     return Settings(
-        bot_token=_get_env("BOT_TOKEN"),
+        bot_token=bot_token,
+        bot_mode=bot_mode,
         database_path=os.getenv("DATABASE_PATH", "data/app.db"),
+        database_readers=_get_int("DATABASE_READERS", 4),
+        fsm_storage=os.getenv("FSM_STORAGE", "sqlite").strip().lower(),
+        fsm_state_ttl_seconds=_get_int("FSM_STATE_TTL_SECONDS", 86400),
+        redis_url=os.getenv("REDIS_URL") or None,
         price_per_generation=_get_int("PRICE_PER_GENERATION", 50),
-        kie_api_key=_get_env("KIE_API_KEY"),
+        kie_api_key=kie_api_key,
         kie_api_base_url=os.getenv("KIE_API_BASE_URL", "https://api.kie.ai"),
         kie_file_base_url=os.getenv("KIE_FILE_BASE_URL", "https://kieai.redpandaai.co"),
         kie_model=os.getenv("KIE_MODEL", "nano-banana-pro"),
         kie_resolution=os.getenv("KIE_RESOLUTION", "4K"),
         kie_aspect_ratio=os.getenv("KIE_ASPECT_RATIO", "1:1"),
         kie_output_format=os.getenv("KIE_OUTPUT_FORMAT", "png"),
+        kie_poll_min_interval_seconds=float(os.getenv("KIE_POLL_MIN_INTERVAL_SECONDS", "2")),
         kie_poll_interval_seconds=_get_int("KIE_POLL_INTERVAL_SECONDS", 5),
+        kie_poll_concurrency=_get_int("KIE_POLL_CONCURRENCY", 20),
+        kie_callback_enabled=kie_callback_enabled,
+        kie_callback_path=os.getenv("KIE_CALLBACK_PATH", "/kie/callback"),
+        kie_callback_secret=os.getenv("KIE_CALLBACK_SECRET")
+        or hashlib.sha256(f"kie-callback:{kie_api_key}".encode()).hexdigest(),
+        kie_callback_fallback_poll_seconds=_get_int("KIE_CALLBACK_FALLBACK_POLL_SECONDS", 30),
+        generation_workers=_get_int("GENERATION_WORKERS", 4),
+        generation_queue_size=_get_int("GENERATION_QUEUE_SIZE", 100),
+        generation_lock_ttl_seconds=_get_int("GENERATION_LOCK_TTL_SECONDS", 120),
+        balance_cache_ttl_seconds=_get_int("BALANCE_CACHE_TTL_SECONDS", 30),
+        balance_cache_max_entries=_get_int("BALANCE_CACHE_MAX_ENTRIES", 10000),
+        result_preview_enabled=_get_bool("RESULT_PREVIEW_ENABLED", False),
+        result_preview_max_side=_get_int("RESULT_PREVIEW_MAX_SIDE", 2560),
+        result_preview_format=result_preview_format,
+        result_preview_quality=_get_int("RESULT_PREVIEW_QUALITY", 85),
+        image_process_workers=_get_int("IMAGE_PROCESS_WORKERS", 2),
+        input_preprocess_enabled=_get_bool("INPUT_PREPROCESS_ENABLED", False),
+        input_max_side=_get_int("INPUT_MAX_SIDE", 2048),
+        input_jpeg_quality=_get_int("INPUT_JPEG_QUALITY", 90),
+        shutdown_timeout_seconds=_get_int("SHUTDOWN_TIMEOUT_SECONDS", 20),
+        metrics_enabled=_get_bool("METRICS_ENABLED", False),
+        metrics_path=os.getenv("METRICS_PATH", "/metrics"),
+        metrics_host=os.getenv("METRICS_HOST", "127.0.0.1"),
+        metrics_port=_get_int("METRICS_PORT", 9100),
         kie_max_poll_seconds=_get_int("KIE_MAX_POLL_SECONDS", 300),
+        kie_http_limit=_get_int("KIE_HTTP_LIMIT", 100),
+        kie_http_limit_per_host=_get_int("KIE_HTTP_LIMIT_PER_HOST", 20),
+        kie_http_dns_ttl_seconds=_get_int("KIE_HTTP_DNS_TTL_SECONDS", 300),
+        kie_http_keepalive_seconds=_get_int("KIE_HTTP_KEEPALIVE_SECONDS", 60),
+        kie_http_timeout_seconds=_get_int("KIE_HTTP_TIMEOUT_SECONDS", 60),
+        kie_upload_buffer_max_bytes=_get_int("KIE_UPLOAD_BUFFER_MAX_BYTES", 10 * 1024 * 1024),
+        kie_upload_cache_ttl_seconds=_get_int("KIE_UPLOAD_CACHE_TTL_SECONDS", 172800),
+        kie_upload_cache_max_entries=_get_int("KIE_UPLOAD_CACHE_MAX_ENTRIES", 10000),
         yookassa_shop_id=_get_env("YOOKASSA_SHOP_ID"),
         yookassa_secret_key=_get_env("YOOKASSA_SECRET_KEY"),
         yookassa_return_url=_get_env("YOOKASSA_RETURN_URL"),
+        yookassa_api_base_url=os.getenv("YOOKASSA_API_BASE_URL", "https://api.yookassa.ru/v3"),
         yookassa_poll_interval_seconds=_get_int("YOOKASSA_POLL_INTERVAL_SECONDS", 15),
+        yookassa_poll_concurrency=_get_int("YOOKASSA_POLL_CONCURRENCY", 50),
+        yookassa_poll_max_backoff_seconds=_get_int("YOOKASSA_POLL_MAX_BACKOFF_SECONDS", 600),
+        yookassa_request_timeout_seconds=_get_int("YOOKASSA_REQUEST_TIMEOUT_SECONDS", 10),
+        yookassa_pending_ttl_seconds=_get_int("YOOKASSA_PENDING_TTL_SECONDS", 86400),
+        payments_archive_after_days=_get_int("PAYMENTS_ARCHIVE_AFTER_DAYS", 30),
+        yookassa_webhook_enabled=_get_bool("YOOKASSA_WEBHOOK_ENABLED"),
+        yookassa_webhook_path=os.getenv("YOOKASSA_WEBHOOK_PATH", "/yookassa/webhook"),
+        yookassa_reconcile_interval_seconds=_get_int("YOOKASSA_RECONCILE_INTERVAL_SECONDS", 300),
         ideas_channel_url=os.getenv("IDEAS_CHANNEL_URL"),
         telegram_photo_max_bytes=_get_optional_int("TELEGRAM_PHOTO_MAX_BYTES"),
+        web_host=os.getenv("WEB_HOST", "0.0.0.0"),
+        web_port=_get_int("WEB_PORT", 8080),
+        web_workers=_get_int("WEB_WORKERS", 1),
+        public_base_url=public_base_url.rstrip("/") if public_base_url else None,
+        telegram_webhook_path=os.getenv("TELEGRAM_WEBHOOK_PATH", "/telegram/webhook"),
+        telegram_webhook_secret=os.getenv("TELEGRAM_WEBHOOK_SECRET")
+        or hashlib.sha256(bot_token.encode()).hexdigest(),
     )
 from dotenv import load_dotenv
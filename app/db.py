@@ -1,12 +1,87 @@
 from __future__ import annotations
 
+import asyncio
+import logging
+from contextlib import asynccontextmanager
+from pathlib import Path
+from typing import AsyncIterator
+
 import aiosqlite
 
+from app.metrics import DB_OPERATION_SECONDS, DB_WAIT_SECONDS
+
+
+class Database:
+    def __init__(self, db_path: str, readers: int = 4, busy_timeout_ms: int = 5000) -> None:
+        self._db_path = db_path
+        self._readers_count = max(1, readers)
+        self._busy_timeout_ms = busy_timeout_ms
+        self._writer: aiosqlite.Connection | None = None
+        self._write_lock = asyncio.Lock()
+        self._readers: asyncio.Queue[aiosqlite.Connection] = asyncio.Queue()
+        self._all_readers: list[aiosqlite.Connection] = []
+
+    async def connect(self) -> None:
+        if self._writer is not None:
+            return
+        Path(self._db_path).parent.mkdir(parents=True, exist_ok=True)
+        self._writer = await aiosqlite.connect(self._db_path)
+        self._writer.row_factory = aiosqlite.Row
+        await self._writer.execute("PRAGMA journal_mode = WAL;")
+        await self._writer.execute("PRAGMA synchronous = NORMAL;")
+        await self._writer.execute(f"PRAGMA busy_timeout = {self._busy_timeout_ms};")
+        await self._writer.execute("PRAGMA foreign_keys = ON;")
+        await self._writer.commit()
+
+        reader_uri = f"{Path(self._db_path).resolve().as_uri()}?mode=ro"
+        for _ in range(self._readers_count):
+            reader = await aiosqlite.connect(reader_uri, uri=True)
+            reader.row_factory = aiosqlite.Row
+            await reader.execute(f"PRAGMA busy_timeout = {self._busy_timeout_ms};")
+            self._all_readers.append(reader)
+            self._readers.put_nowait(reader)
+
+    async def close(self) -> None:
+        for reader in self._all_readers:
+            await reader.close()
+        self._all_readers.clear()
+        self._readers = asyncio.Queue()
+        if self._writer is not None:
+            await self._writer.close()
+            self._writer = None
+
+    @asynccontextmanager
+    async def read(self, operation: str = "other") -> AsyncIterator[aiosqlite.Connection]:
+        with DB_WAIT_SECONDS.time(kind="read"):
+            reader = await self._readers.get()
+        try:
+            with DB_OPERATION_SECONDS.time(kind="read", operation=operation):
+                yield reader
+        finally:
+            self._readers.put_nowait(reader)
+
+    @asynccontextmanager
+    async def write(self, operation: str = "other") -> AsyncIterator[aiosqlite.Connection]:
+        if self._writer is None:
+            raise RuntimeError("Database is not connected")
+        with DB_WAIT_SECONDS.time(kind="write"):
+            await self._write_lock.acquire()
+        try:
+            with DB_OPERATION_SECONDS.time(kind="write", operation=operation):
+                try:
+                    yield self._writer
+                except BaseException:
+                    await self._writer.rollback()
+                    raise
+                await self._writer.commit()
+        finally:
+            self._write_lock.release()
+
 
-async def init_db(db_path: str) -> None:
-    async with aiosqlite.connect(db_path) as db:
-        await db.execute("PRAGMA foreign_keys = ON;")
-        await db.execute(
+MIGRATIONS: list[tuple[int, list[str]]] = [
+    (
+        1,
+        [
             """
             CREATE TABLE IF NOT EXISTS users (
                 user_id INTEGER PRIMARY KEY,
@@ -15,9 +90,7 @@ async def init_db(db_path: str) -> None:
                 referred_by INTEGER,
                 referral_bonus_granted INTEGER DEFAULT 0
             );
-            """
-        )
-        await db.execute(
+            """,
             """
             CREATE TABLE IF NOT EXISTS payments (
                 id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -28,6 +101,193 @@ async def init_db(db_path: str) -> None:
                 status TEXT,
                 created_at DATETIME DEFAULT CURRENT_TIMESTAMP
             );
+            """,
+        ],
+    ),
+    (
+        2,
+        [
+            "CREATE UNIQUE INDEX IF NOT EXISTS idx_payments_payment_id ON payments (payment_id);",
+            (
+                "CREATE INDEX IF NOT EXISTS idx_payments_pending_status ON payments (status) "
+                "WHERE status != 'succeeded';"
+            ),
+            "CREATE INDEX IF NOT EXISTS idx_users_referred_by ON users (referred_by);",
+        ],
+    ),
+    (
+        3,
+        [
+            """
+            CREATE TABLE IF NOT EXISTS payments_archive (
+                id INTEGER PRIMARY KEY,
+                user_id INTEGER,
+                amount INTEGER,
+                generations INTEGER,
+                payment_id TEXT,
+                status TEXT,
+                created_at DATETIME,
+                archived_at DATETIME DEFAULT CURRENT_TIMESTAMP
+            );
+            """,
+            (
+                "CREATE UNIQUE INDEX IF NOT EXISTS idx_payments_archive_payment_id "
+                "ON payments_archive (payment_id);"
+            ),
+            "DROP INDEX IF EXISTS idx_payments_pending_status;",
+            (
+                "CREATE INDEX IF NOT EXISTS idx_payments_live ON payments (created_at) "
+                "WHERE status IN ('pending', 'waiting_for_capture');"
+            ),
+            "CREATE INDEX IF NOT EXISTS idx_payments_created_at ON payments (created_at);",
+        ],
+    ),
+    (
+        4,
+        [
+            """
+            CREATE TABLE IF NOT EXISTS fsm_storage (
+                key TEXT PRIMARY KEY,
+                state TEXT,
+                data TEXT,
+                expires_at REAL NOT NULL
+            );
+            """,
+            "CREATE INDEX IF NOT EXISTS idx_fsm_storage_expires_at ON fsm_storage (expires_at);",
+        ],
+    ),
+    (
+        5,
+        [
+            """
+            CREATE TABLE IF NOT EXISTS upload_cache (
+                file_unique_id TEXT PRIMARY KEY,
+                url TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                last_used_at REAL NOT NULL
+            );
+            """,
+            "CREATE INDEX IF NOT EXISTS idx_upload_cache_last_used_at ON upload_cache (last_used_at);",
+            "CREATE INDEX IF NOT EXISTS idx_upload_cache_created_at ON upload_cache (created_at);",
+        ],
+    ),
+    (
+        6,
+        [
+            """
+            CREATE TABLE IF NOT EXISTS generation_jobs (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                user_id INTEGER NOT NULL,
+                chat_id INTEGER NOT NULL,
+                prompt TEXT NOT NULL,
+                photos TEXT NOT NULL,
+                input_urls TEXT,
+                task_id TEXT,
+                state TEXT NOT NULL,
+                status_message_id INTEGER,
+                error TEXT,
+                created_at REAL NOT NULL,
+                updated_at REAL NOT NULL
+            );
+            """,
+            (
+                "CREATE INDEX IF NOT EXISTS idx_generation_jobs_unfinished ON generation_jobs (id) "
+                "WHERE state IN ('queued', 'uploading', 'submitted', 'delivering');"
+            ),
+            "CREATE INDEX IF NOT EXISTS idx_generation_jobs_user_id ON generation_jobs (user_id);",
+        ],
+    ),
+    (
+        7,
+        [
+            "ALTER TABLE users ADD COLUMN reserved_generations INTEGER NOT NULL DEFAULT 0;",
+        ],
+    ),
+    (
+        8,
+        [
+            """
+            CREATE TABLE IF NOT EXISTS generation_locks (
+                user_id INTEGER PRIMARY KEY,
+                owner TEXT NOT NULL,
+                expires_at REAL NOT NULL
+            );
+            """,
+            "CREATE INDEX IF NOT EXISTS idx_generation_locks_owner ON generation_locks (owner);",
+        ],
+    ),
+    (
+        9,
+        [
+            "ALTER TABLE users ADD COLUMN referrals_count INTEGER NOT NULL DEFAULT 0;",
             """
-        )
-        await db.commit()
+            UPDATE users SET referrals_count = (
+                SELECT COUNT(*) FROM users AS referred
+                WHERE referred.referred_by = users.user_id
+                  AND referred.user_id != users.user_id
+            );
+            """,
+        ],
+    ),
+    (
+        10,
+        [
+            "ALTER TABLE generation_jobs ADD COLUMN result_url TEXT;",
+            "ALTER TABLE generation_jobs ADD COLUMN photo_file_id TEXT;",
+            "ALTER TABLE generation_jobs ADD COLUMN document_file_id TEXT;",
+        ],
+    ),
+    (
+        11,
+        [
+            """
+            CREATE TABLE IF NOT EXISTS fsm_locks (
+                key TEXT PRIMARY KEY,
+                owner TEXT NOT NULL,
+                expires_at REAL NOT NULL
+            );
+            """,
+        ],
+    ),
+    (
+        12,
+        [
+            """
+            CREATE TABLE IF NOT EXISTS kie_task_results (
+                task_id TEXT PRIMARY KEY,
+                status TEXT NOT NULL,
+                image_urls TEXT NOT NULL,
+                created_at REAL NOT NULL
+            );
+            """,
+            (
+                "CREATE INDEX IF NOT EXISTS idx_kie_task_results_created_at "
+                "ON kie_task_results (created_at);"
+            ),
+        ],
+    ),
+]
+
+
+async def get_schema_version(database: Database) -> int:
+    async with database.read("schema.get_schema_version") as db:
+        async with db.execute("PRAGMA user_version") as cursor:
+            row = await cursor.fetchone()
+        return int(row[0]) if row else 0
+
+
+async def init_db(database: Database) -> None:
+    current = await get_schema_version(database)
+    for version, statements in MIGRATIONS:
+        if version <= current:
+            continue
+        async with database.write("schema.init_db") as db:
+            await db.execute("BEGIN IMMEDIATE")
+            async with db.execute("PRAGMA user_version") as cursor:
+                row = await cursor.fetchone()
+            if row and int(row[0]) >= version:
+                continue
+            logging.info("applying db migration version=%s", version)
+            for statement in statements:
+                await db.execute(statement)
+            await db.execute(f"PRAGMA user_version = {version}")
@@ -1,60 +1,66 @@
 from __future__ import annotations
 
 import asyncio
+import contextlib
 import logging
+import multiprocessing
+import os
+import signal
+
 from aiogram import Bot, Dispatcher
-from aiogram.exceptions import TelegramForbiddenError
 
 from app.bot.handlers import AppContext, build_router
+from app.bot.middlewares import TelegramMetricsMiddleware
+from app.bot.storage import SQLiteStorage, build_event_isolation, build_storage
 from app.config import load_settings
-from app.db import init_db
+from app.db import Database, init_db
+from app.metrics import (
+    CACHE_HIT_RATIO,
+    GENERATION_ACTIVE,
+    GENERATION_QUEUE_DEPTH,
+    KIE_TASKS_IN_FLIGHT,
+)
+from app.repositories.jobs import JobRepo
+from app.repositories.kie_results import KieResultRepo
+from app.repositories.locks import LockRepo
 from app.repositories.payments import PaymentRepo
+from app.repositories.uploads import UploadCacheRepo
 from app.repositories.users import UserRepo
 from app.services.balance_service import BalanceService
 from app.services.generation_service import GenerationService
+from app.services.image_processing import ImageProcessor
 from app.services.kie_client import KieClient
+from app.services.kie_task_poller import KieTaskPoller
+from app.services.payment_poller import PaymentPoller
+from app.services.payment_service import PaymentService
 from app.services.referral_service import ReferralService
+from app.services.supervisor import TaskSupervisor
+from app.services.upload_cache_service import UploadCacheService
 from app.services.yookassa_service import YooKassaService
+from app.web.server import build_metrics_app, build_web_app, start_web_server
 
 
-async def poll_payments(ctx: AppContext, bot: Bot) -> None:
-    interval = ctx.settings.yookassa_poll_interval_seconds
-    while True:
-        pending = await ctx.payment_repo.list_pending()
-        for payment_record in pending:
-            payment_id = payment_record["payment_id"]
-            payment = await ctx.yookassa_service.fetch_payment(payment_id)
-            status = payment.get("status")
-            if status == "succeeded":
-                updated = await ctx.payment_repo.mark_succeeded(payment_id)
-                if updated:
-                    user_id = int(payment_record["user_id"])
-                    generations = int(payment_record["generations"])
-                    await ctx.balance_service.add_generations(user_id, generations)
-                    try:
-                        await bot.send_message(
-                            user_id,
-                            "Оплата прошла успешно\n\n"
-                            "Генерации уже доступны.\n"
-                            "Можем продолжать создавать образы.",
-                        )
-                    except TelegramForbiddenError as exc:
-                        logging.warning("payment notify forbidden for user=%s: %s", user_id, exc)
-                continue
-            if status and status != payment_record.get("status"):
-                await ctx.payment_repo.update_status(payment_id, status)
-        await asyncio.sleep(interval)
-
-
-async def run() -> None:
+async def run(worker_index: int = 0) -> None:
     logging.basicConfig(level=logging.INFO)
     settings = load_settings()
-    await init_db(settings.database_path)
+    is_primary = worker_index == 0
+    database = Database(settings.database_path, readers=settings.database_readers)
+    await database.connect()
+    await init_db(database)
 
-    user_repo = UserRepo(settings.database_path)
-    payment_repo = PaymentRepo(settings.database_path)
-    balance_service = BalanceService(user_repo)
-    referral_service = ReferralService(user_repo)
+    user_repo = UserRepo(database)
+    payment_repo = PaymentRepo(database)
+    balance_cache_ttl = settings.balance_cache_ttl_seconds
+    if settings.bot_mode == "webhook" and settings.web_workers > 1:
+        # Balances change in whichever worker handles the update, so a local
+        # cache could serve another worker's stale value.
+        balance_cache_ttl = 0
+    balance_service = BalanceService(
+        user_repo,
+        cache_ttl_seconds=balance_cache_ttl,
+        cache_max_entries=settings.balance_cache_max_entries,
+    )
+    referral_service = ReferralService(user_repo, balance_service)
     kie_client = KieClient(
         api_key=settings.kie_api_key,
         api_base_url=settings.kie_api_base_url,
@@ -63,19 +69,73 @@ async def run() -> None:
         resolution=settings.kie_resolution,
         aspect_ratio=settings.kie_aspect_ratio,
         output_format=settings.kie_output_format,
-        poll_interval_seconds=settings.kie_poll_interval_seconds,
-        max_poll_seconds=settings.kie_max_poll_seconds,
+        connection_limit=settings.kie_http_limit,
+        connection_limit_per_host=settings.kie_http_limit_per_host,
+        dns_cache_ttl_seconds=settings.kie_http_dns_ttl_seconds,
+        keepalive_seconds=settings.kie_http_keepalive_seconds,
+        timeout_seconds=settings.kie_http_timeout_seconds,
+    )
+    kie_callback_url = None
+    kie_poll_min_interval = settings.kie_poll_min_interval_seconds
+    kie_poll_max_interval = settings.kie_poll_interval_seconds
+    if settings.kie_callback_enabled:
+        kie_callback_url = (
+            f"{settings.public_base_url}{settings.kie_callback_path}"
+            f"?token={settings.kie_callback_secret}"
+        )
+        kie_poll_min_interval = settings.kie_callback_fallback_poll_seconds
+        kie_poll_max_interval = settings.kie_callback_fallback_poll_seconds
+    task_poller = KieTaskPoller(
+        kie_client,
+        min_interval_seconds=kie_poll_min_interval,
+        max_interval_seconds=kie_poll_max_interval,
+        max_wait_seconds=settings.kie_max_poll_seconds,
+        concurrency=settings.kie_poll_concurrency,
+        results=KieResultRepo(database) if settings.kie_callback_enabled else None,
     )
+    upload_cache = None
+    if settings.kie_upload_cache_max_entries > 0:
+        upload_cache = UploadCacheService(
+            UploadCacheRepo(database),
+            ttl_seconds=settings.kie_upload_cache_ttl_seconds,
+            max_entries=settings.kie_upload_cache_max_entries,
+        )
+    image_processor = None
+    if settings.result_preview_enabled or settings.input_preprocess_enabled:
+        image_processor = ImageProcessor(workers=settings.image_process_workers)
     generation_service = GenerationService(
         kie_client,
-        user_repo,
+        task_poller,
+        balance_service,
+        JobRepo(database),
+        LockRepo(database),
         telegram_photo_max_bytes=settings.telegram_photo_max_bytes,
+        upload_buffer_max_bytes=settings.kie_upload_buffer_max_bytes,
+        upload_cache=upload_cache,
+        kie_callback_url=kie_callback_url,
+        workers=settings.generation_workers,
+        queue_size=settings.generation_queue_size,
+        lock_ttl_seconds=settings.generation_lock_ttl_seconds,
+        image_processor=image_processor,
+        preview_max_side=(
+            settings.result_preview_max_side if settings.result_preview_enabled else None
+        ),
+        preview_format=settings.result_preview_format,
+        preview_quality=settings.result_preview_quality,
+        input_max_side=(
+            settings.input_max_side if settings.input_preprocess_enabled else None
+        ),
+        input_quality=settings.input_jpeg_quality,
     )
     yookassa_service = YooKassaService(
         shop_id=settings.yookassa_shop_id,
         secret_key=settings.yookassa_secret_key,
         return_url=settings.yookassa_return_url,
+        api_base_url=settings.yookassa_api_base_url,
+        timeout_seconds=settings.yookassa_request_timeout_seconds,
+        max_connections=settings.yookassa_poll_concurrency,
     )
+    payment_service = PaymentService(payment_repo, balance_service)
 
     ctx = AppContext(
         settings=settings,
@@ -85,17 +145,141 @@ async def run() -> None:
         referral_service=referral_service,
         generation_service=generation_service,
         yookassa_service=yookassa_service,
+        payment_service=payment_service,
+        kie_task_poller=task_poller,
     )
 
     bot = Bot(settings.bot_token)
     bot.ctx = ctx
+    bot.session.middleware(TelegramMetricsMiddleware())
+    ctx.bot_username = (await bot.get_me()).username or ""
 
-    dp = Dispatcher()
+    storage = build_storage(settings, database)
+    dp = Dispatcher(
+        storage=storage,
+        events_isolation=build_event_isolation(settings, database, storage),
+    )
+    supervisor = TaskSupervisor()
+    supervisor.install_signal_handlers()
+    if isinstance(storage, SQLiteStorage) and is_primary:
+        supervisor.spawn(
+            storage.run_purge(min(settings.fsm_state_ttl_seconds, 3600)), name="fsm-purge"
+        )
     dp.include_router(build_router())
 
-    asyncio.create_task(poll_payments(ctx, bot))
-    await dp.start_polling(bot)
+    web_runner = None
+    metrics_runner = None
+    poll_interval = settings.yookassa_poll_interval_seconds
+    if settings.yookassa_webhook_enabled:
+        poll_interval = settings.yookassa_reconcile_interval_seconds
+    webhook_mode = settings.bot_mode == "webhook"
+    GENERATION_QUEUE_DEPTH.set_function(lambda: generation_service.queue_depth)
+    GENERATION_ACTIVE.set_function(lambda: generation_service.active_jobs)
+    KIE_TASKS_IN_FLIGHT.set_function(lambda: task_poller.in_flight)
+    CACHE_HIT_RATIO.set_function(lambda: balance_service.hit_ratio, cache="balance")
+    if upload_cache is not None:
+        CACHE_HIT_RATIO.set_function(lambda: upload_cache.hit_ratio, cache="kie_upload")
+    if webhook_mode or settings.yookassa_webhook_enabled or settings.kie_callback_enabled:
+        web_runner = await start_web_server(
+            build_web_app(ctx, bot, dp if webhook_mode else None),
+            settings.web_host,
+            settings.web_port,
+            reuse_port=settings.web_workers > 1,
+        )
+    if settings.metrics_enabled:
+        # Registries are per process, so every worker gets its own private port.
+        metrics_runner = await start_web_server(
+            build_metrics_app(settings.metrics_path),
+            settings.metrics_host,
+            settings.metrics_port + worker_index,
+        )
+
+    supervisor.spawn(task_poller.run(), name="kie-task-poller")
+    generation_service.start()
+    if is_primary:
+        supervisor.spawn(generation_service.recover(bot), name="generation-recovery")
+        payment_poller = PaymentPoller(
+            payment_repo,
+            yookassa_service,
+            payment_service,
+            interval_seconds=poll_interval,
+            concurrency=settings.yookassa_poll_concurrency,
+            max_backoff_seconds=settings.yookassa_poll_max_backoff_seconds,
+            request_timeout_seconds=settings.yookassa_request_timeout_seconds,
+            pending_ttl_seconds=settings.yookassa_pending_ttl_seconds,
+            archive_after_days=settings.payments_archive_after_days,
+        )
+        supervisor.spawn(payment_poller.run(bot), name="payment-poller")
+    try:
+        if webhook_mode:
+            if is_primary:
+                await bot.set_webhook(
+                    f"{settings.public_base_url}{settings.telegram_webhook_path}",
+                    secret_token=settings.telegram_webhook_secret,
+                    allowed_updates=dp.resolve_used_update_types(),
+                )
+            logging.info("worker=%s serving telegram webhook", worker_index)
+        else:
+            supervisor.spawn(
+                dp.start_polling(bot, handle_signals=False, close_bot_session=False),
+                name="telegram-polling",
+                critical=True,
+            )
+        await supervisor.wait_stopped()
+    finally:
+        logging.info("worker=%s shutting down", worker_index)
+        if not webhook_mode:
+            with contextlib.suppress(RuntimeError):
+                await dp.stop_polling()
+        # Jobs keep running while the web server still accepts Kie callbacks;
+        # whatever is unfinished at the deadline is resumed from generation_jobs.
+        await generation_service.stop(timeout=settings.shutdown_timeout_seconds)
+        await supervisor.shutdown(timeout=5)
+        if web_runner is not None:
+            await web_runner.cleanup()
+        if metrics_runner is not None:
+            await metrics_runner.cleanup()
+        await yookassa_service.close()
+        await kie_client.close()
+        if image_processor is not None:
+            image_processor.close()
+        await storage.close()
+        await bot.session.close()
+        await database.close()
+
+
+def _run_worker(worker_index: int) -> None:
+    asyncio.run(run(worker_index))
+
+
+def main() -> None:
+    settings = load_settings()
+    workers = settings.web_workers if settings.bot_mode == "webhook" else 1
+    if workers <= 1:
+        asyncio.run(run())
+        return
+    spawn = multiprocessing.get_context("spawn")
+    processes = [
+        spawn.Process(target=_run_worker, args=(index,), name=f"welly-worker-{index}")
+        for index in range(workers)
+    ]
+    for process in processes:
+        process.start()
+
+    def forward_signal(signum: int, _frame: object) -> None:
+        for process in processes:
+            if process.is_alive():
+                os.kill(process.pid, signum)
+
+    signal.signal(signal.SIGTERM, forward_signal)
+    try:
+        for process in processes:
+            process.join()
+    finally:
+        for process in processes:
+            if process.is_alive():
+                process.terminate()
 
 
 if __name__ == "__main__":
-    asyncio.run(run())
+    main()
@@ -0,0 +1,217 @@
+from __future__ import annotations
+
+import abc
+import bisect
+import math
+import time
+from contextlib import contextmanager
+from typing import Callable, Iterator
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+LabelValues = tuple[str, ...]
+
+
+def _format_labels(names: tuple[str, ...], values: LabelValues, extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class _Metric(abc.ABC):
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple[str, ...] = ()) -> None:
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+
+    def _key(self, labels: dict[str, str]) -> LabelValues:
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    @abc.abstractmethod
+    def samples(self) -> Iterator[str]:
+        ...
+
+    def render(self) -> str:
+        lines = [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} {self.kind}",
+            *self.samples(),
+        ]
+        return "\n".join(lines)
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple[str, ...] = ()) -> None:
+        super().__init__(name, documentation, labelnames)
+        self._values: dict[LabelValues, float] = {}
+
+    def inc(self, amount: float = 1, **labels: str) -> None:
+        key = self._key(labels)
+        self._values[key] = self._values.get(key, 0) + amount
+
+    def samples(self) -> Iterator[str]:
+        for key, value in sorted(self._values.items()):
+            yield f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple[str, ...] = ()) -> None:
+        super().__init__(name, documentation, labelnames)
+        self._values: dict[LabelValues, float] = {}
+        self._functions: dict[LabelValues, Callable[[], float]] = {}
+
+    def set(self, value: float, **labels: str) -> None:
+        self._values[self._key(labels)] = value
+
+    def set_function(self, function: Callable[[], float], **labels: str) -> None:
+        self._functions[self._key(labels)] = function
+
+    def samples(self) -> Iterator[str]:
+        values = dict(self._values)
+        for key, function in self._functions.items():
+            values[key] = function()
+        for key, value in sorted(values.items()):
+            yield f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: tuple[str, ...] = (),
+        buckets: tuple[float, ...] = DEFAULT_BUCKETS,
+    ) -> None:
+        super().__init__(name, documentation, labelnames)
+        self._buckets = tuple(sorted(buckets))
+        self._counts: dict[LabelValues, list[int]] = {}
+        self._sums: dict[LabelValues, float] = {}
+
+    def observe(self, value: float, **labels: str) -> None:
+        key = self._key(labels)
+        counts = self._counts.get(key)
+        if counts is None:
+            counts = self._counts[key] = [0] * (len(self._buckets) + 1)
+            self._sums[key] = 0.0
+        counts[bisect.bisect_left(self._buckets, value)] += 1
+        self._sums[key] += value
+
+    @contextmanager
+    def time(self, **labels: str) -> Iterator[None]:
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def samples(self) -> Iterator[str]:
+        for key, counts in sorted(self._counts.items()):
+            cumulative = 0
+            for bound, count in zip((*self._buckets, math.inf), counts):
+                cumulative += count
+                labels = _format_labels(self.labelnames, key, f'le="{_format_value(bound)}"')
+                yield f"{self.name}_bucket{labels} {cumulative}"
+            labels = _format_labels(self.labelnames, key)
+            yield f"{self.name}_sum{labels} {_format_value(self._sums[key])}"
+            yield f"{self.name}_count{labels} {cumulative}"
+
+
+class MetricsRegistry:
+    def __init__(self) -> None:
+        self._metrics: dict[str, _Metric] = {}
+
+    def register(self, metric: _Metric) -> _Metric:
+        if metric.name in self._metrics:
+            raise RuntimeError(f"Metric already registered: {metric.name}")
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, documentation: str, labelnames: tuple[str, ...] = ()) -> Counter:
+        return self.register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name: str, documentation: str, labelnames: tuple[str, ...] = ()) -> Gauge:
+        return self.register(Gauge(name, documentation, labelnames))
+
+    def histogram(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: tuple[str, ...] = (),
+        buckets: tuple[float, ...] = DEFAULT_BUCKETS,
+    ) -> Histogram:
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def render(self) -> str:
+        return "\n".join(metric.render() for metric in self._metrics.values()) + "\n"
+
+
+REGISTRY = MetricsRegistry()
+
+GENERATION_STAGE_SECONDS = REGISTRY.histogram(
+    "welly_generation_stage_seconds", "Duration of each generation stage.", ("stage",)
+)
+GENERATION_JOBS_TOTAL = REGISTRY.counter(
+    "welly_generation_jobs_total", "Finished generation jobs by outcome.", ("outcome",)
+)
+GENERATION_QUEUE_DEPTH = REGISTRY.gauge(
+    "welly_generation_queue_depth", "Generation jobs waiting for a worker."
+)
+GENERATION_ACTIVE = REGISTRY.gauge(
+    "welly_generation_active", "Generation jobs being processed by workers."
+)
+KIE_TASKS_IN_FLIGHT = REGISTRY.gauge(
+    "welly_kie_tasks_in_flight", "Kie tasks waiting for a result."
+)
+API_REQUEST_SECONDS = REGISTRY.histogram(
+    "welly_api_request_seconds", "Latency of external API calls.", ("service", "method")
+)
+API_ERRORS_TOTAL = REGISTRY.counter(
+    "welly_api_errors_total", "Failed external API calls.", ("service", "method")
+)
+DB_OPERATION_SECONDS = REGISTRY.histogram(
+    "welly_db_operation_seconds",
+    "Time spent holding a database connection, by repository operation.",
+    ("kind", "operation"),
+)
+DB_WAIT_SECONDS = REGISTRY.histogram(
+    "welly_db_wait_seconds",
+    "Time spent waiting for a reader connection or the writer lock.",
+    ("kind",),
+)
+PAYMENTS_PENDING = REGISTRY.gauge(
+    "welly_payments_pending", "Live YooKassa payments seen by the last poll sweep."
+)
+CACHE_HIT_RATIO = REGISTRY.gauge(
+    "welly_cache_hit_ratio", "Hit ratio of in-process caches.", ("cache",)
+)
+
+
+@contextmanager
+def track_api(service: str, method: str) -> Iterator[None]:
+    started = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        API_ERRORS_TOTAL.inc(service=service, method=method)
+        raise
+    finally:
+        API_REQUEST_SECONDS.observe(time.perf_counter() - started, service=service, method=method)
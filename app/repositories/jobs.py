@@ -0,0 +1,109 @@
+from __future__ import annotations
+
+import json
+import time
+
+from app.db import Database
+
+_UNFINISHED_STATES_SQL = "('queued', 'uploading', 'submitted', 'delivering')"
+
+
+class JobRepo:
+    def __init__(self, database: Database) -> None:
+        self._db = database
+
+    async def create_job(
+        self,
+        user_id: int,
+        chat_id: int,
+        prompt: str,
+        photos: list[dict],
+        status_message_id: int | None = None,
+    ) -> int:
+        now = time.time()
+        async with self._db.write("jobs.create_job") as db:
+            cursor = await db.execute(
+                """
+                INSERT INTO generation_jobs (
+                    user_id, chat_id, prompt, photos, status_message_id, state,
+                    created_at, updated_at
+                )
+                VALUES (?, ?, ?, ?, ?, 'queued', ?, ?)
+                """,
+                (user_id, chat_id, prompt, json.dumps(photos), status_message_id, now, now),
+            )
+            return int(cursor.lastrowid)
+
+    async def update_state(
+        self,
+        job_id: int,
+        state: str,
+        *,
+        input_urls: list[str] | None = None,
+        task_id: str | None = None,
+        error: str | None = None,
+    ) -> None:
+        async with self._db.write("jobs.update_state") as db:
+            await db.execute(
+                """
+                UPDATE generation_jobs SET
+                    state = ?,
+                    input_urls = COALESCE(?, input_urls),
+                    task_id = COALESCE(?, task_id),
+                    error = COALESCE(?, error),
+                    updated_at = ?
+                WHERE id = ?
+                """,
+                (
+                    state,
+                    json.dumps(input_urls) if input_urls is not None else None,
+                    task_id,
+                    error,
+                    time.time(),
+                    job_id,
+                ),
+            )
+
+    async def set_result(
+        self,
+        job_id: int,
+        *,
+        result_url: str | None = None,
+        photo_file_id: str | None = None,
+        document_file_id: str | None = None,
+    ) -> None:
+        async with self._db.write("jobs.set_result") as db:
+            await db.execute(
+                """
+                UPDATE generation_jobs SET
+                    result_url = COALESCE(?, result_url),
+                    photo_file_id = COALESCE(?, photo_file_id),
+                    document_file_id = COALESCE(?, document_file_id),
+                    updated_at = ?
+                WHERE id = ?
+                """,
+                (result_url, photo_file_id, document_file_id, time.time(), job_id),
+            )
+
+    async def get_job(self, job_id: int) -> dict | None:
+        async with self._db.read("jobs.get_job") as db:
+            async with db.execute(
+                "SELECT * FROM generation_jobs WHERE id = ?",
+                (job_id,),
+            ) as cursor:
+                row = await cursor.fetchone()
+            return dict(row) if row else None
+
+    async def list_unfinished(self) -> list[dict]:
+        async with self._db.read("jobs.list_unfinished") as db:
+            async with db.execute(
+                f"SELECT * FROM generation_jobs WHERE state IN {_UNFINISHED_STATES_SQL} ORDER BY id"
+            ) as cursor:
+                rows = await cursor.fetchall()
+        jobs = []
+        for row in rows:
+            job = dict(row)
+            job["photos"] = json.loads(job["photos"] or "[]")
+            job["input_urls"] = json.loads(job["input_urls"]) if job["input_urls"] else None
+            jobs.append(job)
+        return jobs
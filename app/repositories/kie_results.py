@@ -0,0 +1,57 @@
+from __future__ import annotations
+
+import json
+import time
+
+from app.db import Database
+
+
+class KieResultRepo:
+    def __init__(self, database: Database) -> None:
+        self._db = database
+
+    async def save(
+        self, task_id: str, status: str, image_urls: list[str], *, keep_seconds: float
+    ) -> None:
+        now = time.time()
+        async with self._db.write("kie_results.save") as db:
+            await db.execute(
+                "DELETE FROM kie_task_results WHERE created_at < ?",
+                (now - keep_seconds,),
+            )
+            await db.execute(
+                """
+                INSERT INTO kie_task_results (task_id, status, image_urls, created_at)
+                VALUES (?, ?, ?, ?)
+                ON CONFLICT(task_id) DO UPDATE SET
+                    status = excluded.status,
+                    image_urls = excluded.image_urls,
+                    created_at = excluded.created_at
+                """,
+                (task_id, status, json.dumps(image_urls), now),
+            )
+
+    async def find(self, task_ids: list[str]) -> dict[str, tuple[str, list[str]]]:
+        if not task_ids:
+            return {}
+        placeholders = ",".join("?" for _ in task_ids)
+        async with self._db.read("kie_results.find") as db:
+            async with db.execute(
+                "SELECT task_id, status, image_urls FROM kie_task_results "
+                f"WHERE task_id IN ({placeholders})",
+                task_ids,
+            ) as cursor:
+                rows = await cursor.fetchall()
+        return {
+            row["task_id"]: (row["status"], json.loads(row["image_urls"] or "[]")) for row in rows
+        }
+
+    async def delete(self, task_ids: list[str]) -> None:
+        if not task_ids:
+            return
+        placeholders = ",".join("?" for _ in task_ids)
+        async with self._db.write("kie_results.delete") as db:
+            await db.execute(
+                f"DELETE FROM kie_task_results WHERE task_id IN ({placeholders})",
+                task_ids,
+            )
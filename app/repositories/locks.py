@@ -0,0 +1,52 @@
+from __future__ import annotations
+
+import time
+
+from app.db import Database
+
+
+class LockRepo:
+    def __init__(self, database: Database) -> None:
+        self._db = database
+
+    async def acquire(
+        self, user_id: int, owner: str, ttl_seconds: float, *, force: bool = False
+    ) -> bool:
+        now = time.time()
+        async with self._db.write("locks.acquire") as db:
+            cursor = await db.execute(
+                """
+                INSERT INTO generation_locks (user_id, owner, expires_at)
+                VALUES (?, ?, ?)
+                ON CONFLICT(user_id) DO UPDATE SET
+                    owner = excluded.owner,
+                    expires_at = excluded.expires_at
+                WHERE ? OR generation_locks.expires_at < ?
+                """,
+                (user_id, owner, now + ttl_seconds, int(force), now),
+            )
+            return cursor.rowcount > 0
+
+    async def release(self, user_id: int, owner: str) -> None:
+        async with self._db.write("locks.release") as db:
+            await db.execute(
+                "DELETE FROM generation_locks WHERE user_id = ? AND owner = ?",
+                (user_id, owner),
+            )
+
+    async def extend(self, owner: str, ttl_seconds: float) -> int:
+        async with self._db.write("locks.extend") as db:
+            cursor = await db.execute(
+                "UPDATE generation_locks SET expires_at = ? WHERE owner = ?",
+                (time.time() + ttl_seconds, owner),
+            )
+            return cursor.rowcount
+
+    async def is_locked(self, user_id: int) -> bool:
+        async with self._db.read("locks.is_locked") as db:
+            async with db.execute(
+                "SELECT 1 FROM generation_locks WHERE user_id = ? AND expires_at >= ?",
+                (user_id, time.time()),
+            ) as cursor:
+                row = await cursor.fetchone()
+            return row is not None
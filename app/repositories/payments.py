@@ -1,11 +1,13 @@
 from __future__ import annotations
 
-import aiosqlite
+from app.db import Database
+
+_LIVE_STATUSES_SQL = "('pending', 'waiting_for_capture')"
 
 
 class PaymentRepo:
-    def __init__(self, db_path: str) -> None:
-        self._db_path = db_path
+    def __init__(self, database: Database) -> None:
+        self._db = database
 
     async def create_payment(
         self,
@@ -15,7 +17,7 @@ class PaymentRepo:
         payment_id: str,
         status: str,
     ) -> None:
-        async with aiosqlite.connect(self._db_path) as db:
+        async with self._db.write("payments.create_payment") as db:
             await db.execute(
                 """
                 INSERT INTO payments (user_id, amount, generations, payment_id, status)
@@ -23,40 +25,76 @@ class PaymentRepo:
                 """,
                 (user_id, amount, generations, payment_id, status),
             )
-            await db.commit()
 
     async def update_status(self, payment_id: str, status: str) -> None:
-        async with aiosqlite.connect(self._db_path) as db:
+        async with self._db.write("payments.update_status") as db:
             await db.execute(
                 "UPDATE payments SET status = ? WHERE payment_id = ?",
                 (status, payment_id),
             )
-            await db.commit()
 
     async def mark_succeeded(self, payment_id: str) -> bool:
-        async with aiosqlite.connect(self._db_path) as db:
+        async with self._db.write("payments.mark_succeeded") as db:
             cursor = await db.execute(
                 "UPDATE payments SET status = 'succeeded' WHERE payment_id = ? AND status != 'succeeded'",
                 (payment_id,),
             )
-            await db.commit()
             return cursor.rowcount > 0
 
     async def get_payment(self, payment_id: str) -> dict | None:
-        async with aiosqlite.connect(self._db_path) as db:
-            db.row_factory = aiosqlite.Row
-            cursor = await db.execute(
+        async with self._db.read("payments.get_payment") as db:
+            async with db.execute(
                 "SELECT * FROM payments WHERE payment_id = ?",
                 (payment_id,),
-            )
-            row = await cursor.fetchone()
+            ) as cursor:
+                row = await cursor.fetchone()
             return dict(row) if row else None
 
     async def list_pending(self) -> list[dict]:
-        async with aiosqlite.connect(self._db_path) as db:
-            db.row_factory = aiosqlite.Row
+        async with self._db.read("payments.list_pending") as db:
+            async with db.execute(
+                f"SELECT * FROM payments WHERE status IN {_LIVE_STATUSES_SQL}"
+            ) as cursor:
+                rows = await cursor.fetchall()
+            return [dict(row) for row in rows]
+
+    async def expire_stale(self, ttl_seconds: int) -> int:
+        async with self._db.write("payments.expire_stale") as db:
             cursor = await db.execute(
-                "SELECT * FROM payments WHERE status != 'succeeded'"
+                f"""
+                UPDATE payments SET status = 'expired'
+                WHERE status IN {_LIVE_STATUSES_SQL} AND created_at < datetime('now', ?)
+                """,
+                (f"-{ttl_seconds} seconds",),
             )
-            rows = await cursor.fetchall()
-            return [dict(row) for row in rows]
+            return cursor.rowcount
+
+    async def archive_settled(self, older_than_days: int, batch_size: int = 500) -> int:
+        archived = 0
+        while True:
+            async with self._db.write("payments.archive_settled") as db:
+                async with db.execute(
+                    f"""
+                    SELECT id FROM payments
+                    WHERE created_at < datetime('now', ?) AND status NOT IN {_LIVE_STATUSES_SQL}
+                    LIMIT ?
+                    """,
+                    (f"-{older_than_days} days", batch_size),
+                ) as cursor:
+                    ids = [row[0] for row in await cursor.fetchall()]
+                if not ids:
+                    return archived
+                placeholders = ", ".join("?" for _ in ids)
+                await db.execute(
+                    f"""
+                    INSERT OR IGNORE INTO payments_archive
+                        (id, user_id, amount, generations, payment_id, status, created_at)
+                    SELECT id, user_id, amount, generations, payment_id, status, created_at
+                    FROM payments WHERE id IN ({placeholders})
+                    """,
+                    ids,
+                )
+                await db.execute(f"DELETE FROM payments WHERE id IN ({placeholders})", ids)
+            archived += len(ids)
+            if len(ids) < batch_size:
+                return archived
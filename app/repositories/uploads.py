@@ -0,0 +1,57 @@
+from __future__ import annotations
+
+import time
+
+from app.db import Database
+
+
+class UploadCacheRepo:
+    def __init__(self, database: Database) -> None:
+        self._db = database
+
+    async def get_url(self, file_unique_id: str, ttl_seconds: int) -> str | None:
+        now = time.time()
+        async with self._db.write("uploads.get_url") as db:
+            cursor = await db.execute(
+                """
+                UPDATE upload_cache SET last_used_at = ?
+                WHERE file_unique_id = ? AND created_at >= ?
+                RETURNING url
+                """,
+                (now, file_unique_id, now - ttl_seconds),
+            )
+            row = await cursor.fetchone()
+            await cursor.close()
+            return str(row[0]) if row else None
+
+    async def put_url(self, file_unique_id: str, url: str) -> None:
+        now = time.time()
+        async with self._db.write("uploads.put_url") as db:
+            await db.execute(
+                """
+                INSERT INTO upload_cache (file_unique_id, url, created_at, last_used_at)
+                VALUES (?, ?, ?, ?)
+                ON CONFLICT(file_unique_id) DO UPDATE SET
+                    url = excluded.url,
+                    created_at = excluded.created_at,
+                    last_used_at = excluded.last_used_at
+                """,
+                (file_unique_id, url, now, now),
+            )
+
+    async def evict(self, ttl_seconds: int, max_entries: int) -> int:
+        async with self._db.write("uploads.evict") as db:
+            expired = await db.execute(
+                "DELETE FROM upload_cache WHERE created_at < ?",
+                (time.time() - ttl_seconds,),
+            )
+            overflow = await db.execute(
+                """
+                DELETE FROM upload_cache WHERE file_unique_id IN (
+                    SELECT file_unique_id FROM upload_cache
+                    ORDER BY last_used_at DESC LIMIT -1 OFFSET ?
+                )
+                """,
+                (max_entries,),
+            )
+            return expired.rowcount + overflow.rowcount
@@ -1,26 +1,25 @@
 from __future__ import annotations
 
-import aiosqlite
+from app.db import Database
 
 
 class UserRepo:
-    def __init__(self, db_path: str) -> None:
-        self._db_path = db_path
+    def __init__(self, database: Database) -> None:
+        self._db = database
 
     async def get_user(self, user_id: int) -> dict | None:
-        async with aiosqlite.connect(self._db_path) as db:
-            db.row_factory = aiosqlite.Row
-            cursor = await db.execute(
+        async with self._db.read("users.get_user") as db:
+            async with db.execute(
                 "SELECT * FROM users WHERE user_id = ?",
                 (user_id,),
-            )
-            row = await cursor.fetchone()
+            ) as cursor:
+                row = await cursor.fetchone()
             return dict(row) if row else None
 
     async def create_user(
         self, user_id: int, referred_by: int | None, bonus_generations: int
     ) -> None:
-        async with aiosqlite.connect(self._db_path) as db:
+        async with self._db.write("users.create_user") as db:
             await db.execute(
                 """
                 INSERT INTO users (user_id, bonus_generations, total_generations_used, referred_by)
@@ -28,61 +27,98 @@ class UserRepo:
                 """,
                 (user_id, bonus_generations, referred_by),
             )
-            await db.commit()
+            if referred_by is not None and referred_by != user_id:
+                await db.execute(
+                    "UPDATE users SET referrals_count = referrals_count + 1 WHERE user_id = ?",
+                    (referred_by,),
+                )
 
-    async def add_generations(self, user_id: int, amount: int) -> None:
-        async with aiosqlite.connect(self._db_path) as db:
-            await db.execute(
-                "UPDATE users SET bonus_generations = bonus_generations + ? WHERE user_id = ?",
+    async def add_generations(self, user_id: int, amount: int) -> int | None:
+        async with self._db.write("users.add_generations") as db:
+            async with db.execute(
+                """
+                UPDATE users SET bonus_generations = bonus_generations + ?
+                WHERE user_id = ?
+                RETURNING bonus_generations
+                """,
                 (amount, user_id),
-            )
-            await db.commit()
+            ) as cursor:
+                row = await cursor.fetchone()
+            return int(row[0]) if row else None
 
-    async def consume_generation(self, user_id: int) -> bool:
-        async with aiosqlite.connect(self._db_path) as db:
-            cursor = await db.execute(
+    async def reserve_generation(self, user_id: int) -> int | None:
+        async with self._db.write("users.reserve_generation") as db:
+            async with db.execute(
                 """
                 UPDATE users
                 SET bonus_generations = bonus_generations - 1,
-                    total_generations_used = total_generations_used + 1
+                    reserved_generations = reserved_generations + 1
                 WHERE user_id = ? AND bonus_generations > 0
+                RETURNING bonus_generations
+                """,
+                (user_id,),
+            ) as cursor:
+                row = await cursor.fetchone()
+            return int(row[0]) if row else None
+
+    async def commit_generation(self, user_id: int) -> bool:
+        async with self._db.write("users.commit_generation") as db:
+            cursor = await db.execute(
+                """
+                UPDATE users
+                SET reserved_generations = reserved_generations - 1,
+                    total_generations_used = total_generations_used + 1
+                WHERE user_id = ? AND reserved_generations > 0
                 """,
                 (user_id,),
             )
-            await db.commit()
             return cursor.rowcount > 0
 
+    async def release_generation(self, user_id: int) -> int | None:
+        async with self._db.write("users.release_generation") as db:
+            async with db.execute(
+                """
+                UPDATE users
+                SET bonus_generations = bonus_generations + 1,
+                    reserved_generations = reserved_generations - 1
+                WHERE user_id = ? AND reserved_generations > 0
+                RETURNING bonus_generations
+                """,
+                (user_id,),
+            ) as cursor:
+                row = await cursor.fetchone()
+            return int(row[0]) if row else None
+
     async def get_balance(self, user_id: int) -> int:
-        async with aiosqlite.connect(self._db_path) as db:
-            cursor = await db.execute(
+        async with self._db.read("users.get_balance") as db:
+            async with db.execute(
                 "SELECT bonus_generations FROM users WHERE user_id = ?",
                 (user_id,),
-            )
-            row = await cursor.fetchone()
+            ) as cursor:
+                row = await cursor.fetchone()
             return int(row[0]) if row else 0
 
     async def set_referral_bonus_granted(self, user_id: int) -> None:
-        async with aiosqlite.connect(self._db_path) as db:
+        async with self._db.write("users.set_referral_bonus_granted") as db:
             await db.execute(
                 "UPDATE users SET referral_bonus_granted = 1 WHERE user_id = ?",
                 (user_id,),
             )
-            await db.commit()
 
     async def is_referral_bonus_granted(self, user_id: int) -> bool:
-        async with aiosqlite.connect(self._db_path) as db:
-            cursor = await db.execute(
+        async with self._db.read("users.is_referral_bonus_granted") as db:
+            async with db.execute(
                 "SELECT referral_bonus_granted FROM users WHERE user_id = ?",
                 (user_id,),
-            )
-            row = await cursor.fetchone()
+            ) as cursor:
+                row = await cursor.fetchone()
             return bool(row[0]) if row else False
 
     async def count_referrals(self, referrer_id: int) -> int:
-        async with aiosqlite.connect(self._db_path) as db:
-            cursor = await db.execute(
-                "SELECT COUNT(*) FROM users WHERE referred_by = ?",
+        async with self._db.read("users.count_referrals") as db:
+            async with db.execute(
+                "SELECT referrals_count FROM users WHERE user_id = ?",
                 (referrer_id,),
-            )
-            row = await cursor.fetchone()
+            ) as cursor:
+                row = await cursor.fetchone()
             return int(row[0]) if row else 0
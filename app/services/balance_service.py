@@ -1,17 +1,108 @@
 from __future__ import annotations
 
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+
 from app.repositories.users import UserRepo
 
 
+@dataclass(slots=True)
+class _CachedBalance:
+    balance: int
+    expires_at: float
+
+
 class BalanceService:
-    def __init__(self, user_repo: UserRepo) -> None:
+    def __init__(
+        self,
+        user_repo: UserRepo,
+        cache_ttl_seconds: float = 30,
+        cache_max_entries: int = 10000,
+    ) -> None:
         self._user_repo = user_repo
+        self._cache_ttl_seconds = cache_ttl_seconds
+        self._cache_max_entries = max(1, cache_max_entries)
+        self._cache: OrderedDict[int, _CachedBalance] = OrderedDict()
+        # Bumped on every write so a read that raced with it is not cached.
+        self._writes = 0
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def hit_ratio(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    async def user_exists(self, user_id: int) -> bool:
+        if self._cached(user_id) is not None:
+            return True
+        return await self._load(user_id) is not None
+
+    async def ensure_user(
+        self, user_id: int, referred_by: int | None, bonus_generations: int
+    ) -> bool:
+        if await self.user_exists(user_id):
+            return False
+        await self._user_repo.create_user(user_id, referred_by, bonus_generations)
+        self._apply(user_id, bonus_generations)
+        return True
 
     async def get_balance(self, user_id: int) -> int:
-        return await self._user_repo.get_balance(user_id)
+        cached = self._cached(user_id)
+        if cached is not None:
+            return cached
+        balance = await self._load(user_id)
+        return balance if balance is not None else 0
 
     async def add_generations(self, user_id: int, amount: int) -> None:
-        await self._user_repo.add_generations(user_id, amount)
+        self._apply(user_id, await self._user_repo.add_generations(user_id, amount))
+
+    async def reserve_generation(self, user_id: int) -> bool:
+        balance = await self._user_repo.reserve_generation(user_id)
+        self._apply(user_id, balance)
+        return balance is not None
+
+    async def commit_generation(self, user_id: int) -> bool:
+        return await self._user_repo.commit_generation(user_id)
+
+    async def release_generation(self, user_id: int) -> bool:
+        balance = await self._user_repo.release_generation(user_id)
+        self._apply(user_id, balance)
+        return balance is not None
+
+    async def _load(self, user_id: int) -> int | None:
+        writes = self._writes
+        user = await self._user_repo.get_user(user_id)
+        if user is None:
+            return None
+        balance = int(user["bonus_generations"])
+        if writes == self._writes:
+            self._store(user_id, balance)
+        return balance
+
+    def _cached(self, user_id: int) -> int | None:
+        if self._cache_ttl_seconds <= 0:
+            return None
+        entry = self._cache.get(user_id)
+        if entry is None or entry.expires_at < time.monotonic():
+            self.misses += 1
+            return None
+        self._cache.move_to_end(user_id)
+        self.hits += 1
+        return entry.balance
+
+    def _store(self, user_id: int, balance: int) -> None:
+        if self._cache_ttl_seconds <= 0:
+            return
+        self._cache[user_id] = _CachedBalance(balance, time.monotonic() + self._cache_ttl_seconds)
+        self._cache.move_to_end(user_id)
+        while len(self._cache) > self._cache_max_entries:
+            self._cache.popitem(last=False)
 
-    async def consume_generation(self, user_id: int) -> bool:
-        return await self._user_repo.consume_generation(user_id)
+    def _apply(self, user_id: int, balance: int | None) -> None:
+        self._writes += 1
+        if balance is None:
+            self._cache.pop(user_id, None)
+        else:
+            self._store(user_id, balance)
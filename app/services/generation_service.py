@@ -1,99 +1,437 @@
 from __future__ import annotations
 
+import asyncio
+import inspect
 import logging
 import os
-import tempfile
+import socket
+import time
+from dataclasses import dataclass
 from pathlib import Path
-from typing import Sequence
+from typing import AsyncIterator, Sequence
+from urllib.parse import urlsplit
+from uuid import uuid4
 
 import aiohttp
 from aiogram import Bot
 from aiogram.exceptions import TelegramBadRequest
-from aiogram.types import FSInputFile
+from aiogram.types import BufferedInputFile, Message
 
 from app.bot.keyboards import result_actions_keyboard
-from app.repositories.users import UserRepo
+from app.metrics import GENERATION_JOBS_TOTAL, GENERATION_STAGE_SECONDS
+from app.repositories.jobs import JobRepo
+from app.repositories.locks import LockRepo
+from app.services.balance_service import BalanceService
+from app.services.image_processing import ImageProcessor
 from app.services.kie_client import KieClient
+from app.services.kie_task_poller import KieTaskPoller
+from app.services.upload_cache_service import UploadCacheService
+
+RESULT_CAPTION = "Готово ✨\nХочешь попробовать другой стиль или сохранить этот образ?"
+TELEGRAM_DOCUMENT_MAX_BYTES = 50 * 1024 * 1024
+COMMIT_ATTEMPTS = 3
+
+
+class GenerationBusyError(RuntimeError):
+    pass
+
+
+@dataclass(slots=True)
+class InputPhoto:
+    file_id: str
+    file_unique_id: str | None = None
+
+
+@dataclass(slots=True)
+class GenerationJob:
+    bot: Bot
+    user_id: int
+    chat_id: int
+    prompt: str
+    photos: Sequence[InputPhoto]
+    status_message_id: int | None = None
+    job_id: int | None = None
+    input_urls: list[str] | None = None
+    task_id: str | None = None
+    delivered: bool = False
 
 
 class GenerationService:
     def __init__(
         self,
         kie_client: KieClient,
-        user_repo: UserRepo,
+        task_poller: KieTaskPoller,
+        balance_service: BalanceService,
+        job_repo: JobRepo,
+        lock_repo: LockRepo,
         telegram_photo_max_bytes: int | None = None,
+        upload_buffer_max_bytes: int = 10 * 1024 * 1024,
+        upload_cache: UploadCacheService | None = None,
+        kie_callback_url: str | None = None,
+        image_processor: ImageProcessor | None = None,
+        preview_max_side: int | None = None,
+        preview_format: str = "jpeg",
+        preview_quality: int = 85,
+        input_max_side: int | None = None,
+        input_quality: int = 90,
+        workers: int = 4,
+        queue_size: int = 100,
+        lock_ttl_seconds: float = 120,
     ) -> None:
         self._kie_client = kie_client
-        self._user_repo = user_repo
+        self._task_poller = task_poller
+        self._balance_service = balance_service
+        self._job_repo = job_repo
+        self._lock_repo = lock_repo
+        self._lock_ttl_seconds = lock_ttl_seconds
+        self._lock_owner = f"{socket.gethostname()}:{os.getpid()}:{uuid4().hex[:8]}"
         self._locks: set[int] = set()
+        self._heartbeat_task: asyncio.Task | None = None
         self._telegram_photo_max_bytes = telegram_photo_max_bytes
+        self._upload_buffer_max_bytes = upload_buffer_max_bytes
+        self._upload_cache = upload_cache
+        self._kie_callback_url = kie_callback_url
+        self._image_processor = image_processor
+        self._preview_max_side = preview_max_side
+        self._preview_format = preview_format
+        self._preview_quality = preview_quality
+        self._input_max_side = input_max_side
+        self._input_quality = input_quality
+        self._worker_count = max(1, workers)
+        self._queue: asyncio.Queue[GenerationJob] = asyncio.Queue(maxsize=max(1, queue_size))
+        self._workers: list[asyncio.Task] = []
+        self._busy_workers: set[asyncio.Task] = set()
+        self._active = 0
+        self._accepting = True
 
-    def is_busy(self, user_id: int) -> bool:
-        return user_id in self._locks
+    @property
+    def queue_depth(self) -> int:
+        return self._queue.qsize()
 
-    async def generate(
-        self,
-        bot: Bot,
-        user_id: int,
-        chat_id: int,
-        prompt: str,
-        photo_file_ids: Sequence[str],
-        status_message_id: int | None = None,
-    ) -> None:
-        if user_id in self._locks:
-            await bot.send_message(chat_id, "⏳ Генерация уже запущена. Дождитесь результата.")
+    @property
+    def active_jobs(self) -> int:
+        return self._active
+
+    async def is_busy(self, user_id: int) -> bool:
+        return user_id in self._locks or await self._lock_repo.is_locked(user_id)
+
+    def start(self) -> None:
+        if self._workers:
             return
-        self._locks.add(user_id)
+        self._workers = [
+            asyncio.create_task(self._worker(), name=f"generation-worker-{index}")
+            for index in range(self._worker_count)
+        ]
+        self._heartbeat_task = asyncio.create_task(
+            self._heartbeat(), name="generation-lock-heartbeat"
+        )
+
+    async def stop(self, timeout: float = 0) -> None:
+        self._accepting = False
+        for worker in self._workers:
+            if worker not in self._busy_workers:
+                worker.cancel()
+        busy = list(self._busy_workers)
+        if busy and timeout > 0:
+            logging.info("draining generation jobs count=%s timeout=%ss", len(busy), timeout)
+            await asyncio.wait(busy, timeout=timeout)
+        tasks = [*self._workers]
+        if self._heartbeat_task is not None:
+            tasks.append(self._heartbeat_task)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        if self._queue.qsize() or busy:
+            logging.info(
+                "generation jobs left for recovery queued=%s interrupted=%s",
+                self._queue.qsize(),
+                sum(1 for task in busy if task.cancelled()),
+            )
+        self._workers = []
+        self._heartbeat_task = None
+
+    async def enqueue(self, job: GenerationJob) -> int | None:
+        if job.user_id in self._locks:
+            raise GenerationBusyError(f"generation already running for user {job.user_id}")
+        if not self._accepting or self._queue.full():
+            return None
+        if not await self._lock_repo.acquire(
+            job.user_id, self._lock_owner, self._lock_ttl_seconds
+        ):
+            raise GenerationBusyError(f"generation already running for user {job.user_id}")
+        self._locks.add(job.user_id)
         try:
-            logging.info("generation start user=%s photos=%s", user_id, len(photo_file_ids))
-            async with aiohttp.ClientSession() as session:
-                image_urls = []
-                for file_id in photo_file_ids:
-                    logging.info("downloading telegram file_id=%s", file_id)
-                    file = await bot.get_file(file_id)
-                    with tempfile.NamedTemporaryFile(delete=False, suffix=".jpg") as tmp:
-                        temp_path = tmp.name
-                    await bot.download_file(file.file_path, temp_path)
-                    try:
-                        upload_path = f"telegram/{user_id}"
-                        logging.info("uploading to kie: %s", temp_path)
-                        url = await self._kie_client.upload_file(session, temp_path, upload_path)
-                        image_urls.append(url)
-                        logging.info("uploaded url=%s", url)
-                    finally:
-                        if os.path.exists(temp_path):
-                            os.remove(temp_path)
-
-                logging.info("creating kie task")
-                task_id = await self._kie_client.create_task(session, prompt, image_urls)
-                logging.info("kie task_id=%s", task_id)
-                result = await self._kie_client.poll_task(session, task_id)
-                logging.info("kie result status=%s urls=%s", result.status, result.image_urls)
-                if not result.image_urls:
-                    logging.warning("generation failed status=%s", result.status)
-                    await self._try_delete_message(bot, chat_id, status_message_id)
-                    await bot.send_message(
-                        chat_id,
-                        "К сожалению, это изображение не подходит для обработки. "
-                        "Попробуй загрузить другое фото",
-                    )
-                    return
-
-                image_url = result.image_urls[0]
-                await self._send_generated_image(bot, chat_id, session, image_url)
-                await self._try_delete_message(bot, chat_id, status_message_id)
-                consumed = await self._user_repo.consume_generation(user_id)
-                if not consumed:
-                    await bot.send_message(
-                        chat_id,
-                        "⚠️ Генерация готова, но списание не удалось. Проверьте баланс.",
-                    )
+            job.job_id = await self._job_repo.create_job(
+                job.user_id,
+                job.chat_id,
+                job.prompt,
+                [{"file_id": p.file_id, "file_unique_id": p.file_unique_id} for p in job.photos],
+                status_message_id=job.status_message_id,
+            )
+        except Exception:
+            await self._release_lock(job.user_id)
+            raise
+        if self._queue.full():
+            await self._set_state(job, "failed", error="queue full")
+            await self._release_lock(job.user_id)
+            return None
+        ahead = self._queue.qsize()
+        self._queue.put_nowait(job)
+        logging.info(
+            "generation queued job=%s user=%s depth=%s", job.job_id, job.user_id, self._queue.qsize()
+        )
+        if self._active + ahead >= self._worker_count:
+            return ahead + 1
+        return 0
+
+    async def recover(self, bot: Bot) -> int:
+        jobs = await self._job_repo.list_unfinished()
+        for row in jobs:
+            job = GenerationJob(
+                bot=bot,
+                user_id=int(row["user_id"]),
+                chat_id=int(row["chat_id"]),
+                prompt=row["prompt"],
+                photos=[
+                    InputPhoto(item["file_id"], item.get("file_unique_id"))
+                    for item in row["photos"]
+                ],
+                status_message_id=row["status_message_id"],
+                job_id=int(row["id"]),
+                input_urls=row["input_urls"],
+                task_id=row["task_id"],
+                delivered=bool(row["photo_file_id"] or row["document_file_id"]),
+            )
+            if row["state"] == "delivering" and job.delivered:
+                logging.info("committing delivered generation job=%s", job.job_id)
+                await self._commit(job)
+                continue
+            logging.info(
+                "recovering generation job=%s state=%s task_id=%s",
+                job.job_id,
+                row["state"],
+                job.task_id,
+            )
+            await self._lock_repo.acquire(
+                job.user_id, self._lock_owner, self._lock_ttl_seconds, force=True
+            )
+            self._locks.add(job.user_id)
+            await self._queue.put(job)
+        return len(jobs)
+
+    async def _worker(self) -> None:
+        worker = asyncio.current_task()
+        while self._accepting:
+            job = await self._queue.get()
+            self._active += 1
+            self._busy_workers.add(worker)
+            interrupted = False
+            try:
+                await self._process(job)
+            except asyncio.CancelledError:
+                interrupted = True
+                raise
+            finally:
+                self._busy_workers.discard(worker)
+                self._active -= 1
+                if interrupted:
+                    # The job is left for recover(); the lease expires or is taken over there.
+                    logging.info("keeping generation lease for recovery job=%s", job.job_id)
+                else:
+                    await self._release_lock(job.user_id)
+                self._queue.task_done()
+
+    async def _release_lock(self, user_id: int) -> None:
+        self._locks.discard(user_id)
+        try:
+            await self._lock_repo.release(user_id, self._lock_owner)
         except Exception:
+            logging.exception("failed to release generation lock user=%s", user_id)
+
+    async def _heartbeat(self) -> None:
+        interval = max(1.0, self._lock_ttl_seconds / 3)
+        while True:
+            await asyncio.sleep(interval)
+            if not self._locks:
+                continue
+            try:
+                await self._lock_repo.extend(self._lock_owner, self._lock_ttl_seconds)
+            except Exception:
+                logging.exception("generation lock heartbeat failed")
+
+    async def _process(self, job: GenerationJob) -> None:
+        bot = job.bot
+        user_id = job.user_id
+        chat_id = job.chat_id
+        try:
+            logging.info("generation start job=%s user=%s", job.job_id, user_id)
+            connections_before = self._kie_client.connection_stats()
+            session = self._kie_client.session
+            if job.task_id is None:
+                if job.input_urls is None:
+                    await self._set_state(job, "uploading")
+                    stage_started = time.perf_counter()
+                    async with asyncio.TaskGroup() as group:
+                        upload_tasks = [
+                            group.create_task(self._upload_photo(bot, user_id, photo))
+                            for photo in job.photos
+                        ]
+                    job.input_urls = [task.result() for task in upload_tasks]
+                    self._log_stage("inputs", user_id, stage_started)
+
+                stage_started = time.perf_counter()
+                job.task_id = await self._kie_client.create_task(
+                    job.prompt, job.input_urls, callback_url=self._kie_callback_url
+                )
+                self._log_stage("create_task", user_id, stage_started)
+                await self._set_state(
+                    job, "submitted", input_urls=job.input_urls, task_id=job.task_id
+                )
+            logging.info("kie task_id=%s", job.task_id)
+            stage_started = time.perf_counter()
+            result = await self._task_poller.wait(job.task_id)
+            self._log_stage("result", user_id, stage_started)
+            logging.info("kie result status=%s urls=%s", result.status, result.image_urls)
+            if not result.image_urls:
+                logging.warning("generation failed status=%s", result.status)
+                await self._set_state(job, "failed", error=f"kie status {result.status}")
+                GENERATION_JOBS_TOTAL.inc(outcome="rejected")
+                await self._release(user_id)
+                await self._try_delete_message(bot, chat_id, job.status_message_id)
+                await bot.send_message(
+                    chat_id,
+                    "К сожалению, это изображение не подходит для обработки. "
+                    "Попробуй загрузить другое фото",
+                )
+                return
+
+            await self._set_state(job, "delivering")
+            image_url = result.image_urls[0]
+            stage_started = time.perf_counter()
+            if job.delivered:
+                logging.info("generation already delivered job=%s", job.job_id)
+            else:
+                await self._send_generated_image(job, session, image_url)
+            self._log_stage("delivery", user_id, stage_started)
+            GENERATION_JOBS_TOTAL.inc(outcome="done")
+            await self._try_delete_message(bot, chat_id, job.status_message_id)
+            created_before, reused_before = connections_before
+            created_after, reused_after = self._kie_client.connection_stats()
+            logging.info(
+                "generation http connections user=%s new=%s reused=%s",
+                user_id,
+                created_after - created_before,
+                reused_after - reused_before,
+            )
+        except Exception as exc:
             logging.exception("generation error user=%s", user_id)
-            await bot.send_message(chat_id, "⚠️ Ошибка генерации. Попробуйте ещё раз позже.")
+            if not job.delivered:
+                await self._set_state(job, "failed", error=repr(exc)[:500])
+                GENERATION_JOBS_TOTAL.inc(outcome="failed")
+                await self._release(user_id)
+                await bot.send_message(chat_id, "⚠️ Ошибка генерации. Попробуйте ещё раз позже.")
         finally:
-            logging.info("generation finish user=%s", user_id)
-            self._locks.discard(user_id)
+            if job.delivered:
+                await self._commit(job)
+            logging.info("generation finish job=%s user=%s", job.job_id, user_id)
+
+    async def _commit(self, job: GenerationJob) -> None:
+        for attempt in range(COMMIT_ATTEMPTS):
+            try:
+                committed = await self._balance_service.commit_generation(job.user_id)
+            except Exception:
+                logging.exception(
+                    "failed to commit generation job=%s attempt=%s", job.job_id, attempt + 1
+                )
+                if attempt + 1 < COMMIT_ATTEMPTS:
+                    await asyncio.sleep(0.5 * 2**attempt)
+                continue
+            if not committed:
+                logging.warning("generation delivered without reservation user=%s", job.user_id)
+            await self._set_state(job, "done")
+            return
+        logging.error("generation left delivering for recovery job=%s", job.job_id)
+
+    async def _release(self, user_id: int) -> None:
+        try:
+            await self._balance_service.release_generation(user_id)
+        except Exception:
+            logging.exception("failed to release reserved generation user=%s", user_id)
+
+    async def _set_state(self, job: GenerationJob, state: str, **fields) -> None:
+        if job.job_id is None:
+            return
+        try:
+            await self._job_repo.update_state(job.job_id, state, **fields)
+        except Exception:
+            logging.exception("failed to persist job=%s state=%s", job.job_id, state)
+
+    async def _upload_photo(self, bot: Bot, user_id: int, photo: InputPhoto) -> str:
+        if self._upload_cache and photo.file_unique_id:
+            cached_url = await self._upload_cache.get_url(photo.file_unique_id)
+            if cached_url:
+                logging.info(
+                    "upload cache hit file_unique_id=%s hit_ratio=%.2f",
+                    photo.file_unique_id,
+                    self._upload_cache.hit_ratio,
+                )
+                return cached_url
+        stage_started = time.perf_counter()
+        content, filename = await self._open_telegram_file(bot, photo.file_id)
+        self._log_stage("telegram_fetch", user_id, stage_started)
+        if isinstance(content, bytes):
+            content, filename = await self._prepare_input(user_id, content, filename)
+        try:
+            stage_started = time.perf_counter()
+            url = await self._kie_client.upload_file(content, filename, f"telegram/{user_id}")
+            self._log_stage("kie_upload", user_id, stage_started)
+        finally:
+            if inspect.isasyncgen(content):
+                await content.aclose()
+        logging.info("uploaded file_id=%s url=%s", photo.file_id, url)
+        if self._upload_cache and photo.file_unique_id:
+            await self._upload_cache.put_url(photo.file_unique_id, url)
+        return url
+
+    async def _prepare_input(
+        self, user_id: int, content: bytes, filename: str
+    ) -> tuple[bytes, str]:
+        if self._image_processor is None or not self._input_max_side:
+            return content, filename
+        stage_started = time.perf_counter()
+        try:
+            prepared = await self._image_processor.prepare_input(
+                content, self._input_max_side, self._input_quality
+            )
+        except Exception:
+            logging.exception("input preprocessing failed, uploading original")
+            return content, filename
+        self._log_stage("preprocess", user_id, stage_started)
+        if prepared is None:
+            return content, filename
+        logging.info("input preprocessed bytes=%s original=%s", len(prepared), len(content))
+        return prepared, f"{Path(filename).stem}.jpg"
+
+    @staticmethod
+    def _log_stage(stage: str, user_id: int, started: float) -> None:
+        elapsed = time.perf_counter() - started
+        GENERATION_STAGE_SECONDS.observe(elapsed, stage=stage)
+        logging.info("generation stage=%s user=%s took=%.2fs", stage, user_id, elapsed)
+
+    async def _open_telegram_file(
+        self, bot: Bot, file_id: str
+    ) -> tuple[bytes | AsyncIterator[bytes], str]:
+        file = await bot.get_file(file_id)
+        filename = Path(file.file_path or "").name or f"{file_id}.jpg"
+        small = file.file_size is not None and file.file_size <= self._upload_buffer_max_bytes
+        if small or bot.session.api.is_local:
+            buffer = await bot.download_file(file.file_path)
+            return buffer.getvalue(), filename
+        stream = bot.session.stream_content(
+            url=bot.session.api.file_url(bot.token, file.file_path),
+            raise_for_status=True,
+        )
+        return stream, filename
 
     async def _try_delete_message(
         self, bot: Bot, chat_id: int, message_id: int | None
@@ -105,96 +443,124 @@ class GenerationService:
         except Exception:
             logging.warning("failed to delete status message id=%s", message_id)
 
+    async def send_original(self, bot: Bot, chat_id: int, user_id: int, job_id: int) -> bool:
+        job = await self._job_repo.get_job(job_id)
+        if job is None or int(job["user_id"]) != user_id or not job["result_url"]:
+            return False
+        if job["document_file_id"]:
+            await bot.send_document(chat_id, document=job["document_file_id"])
+            return True
+        content = await self._download_result(self._kie_client.session, job["result_url"])
+        message = await bot.send_document(
+            chat_id,
+            document=BufferedInputFile(content, filename=self._result_filename(job["result_url"])),
+        )
+        await self._job_repo.set_result(job_id, document_file_id=message.document.file_id)
+        return True
+
     async def _send_generated_image(
         self,
-        bot: Bot,
-        chat_id: int,
+        job: GenerationJob,
         session: aiohttp.ClientSession,
         image_url: str,
     ) -> None:
-        if await self._should_send_as_document(session, image_url):
-            logging.info("sending generated image as document url=%s", image_url)
-            await self._send_file_from_url(
-                bot, chat_id, session, image_url, as_document=True
-            )
+        if job.job_id is not None:
+            await self._job_repo.set_result(job.job_id, result_url=image_url)
+        message = None
+        if self._image_processor is not None and self._preview_max_side:
+            try:
+                message = await self._send_preview(job, session, image_url)
+            except Exception:
+                logging.exception("preview failed, sending original url=%s", image_url)
+        if message is None:
+            message = await self._send_by_url(job, session, image_url)
+        job.delivered = True
+        if job.job_id is None:
             return
-        try:
-            logging.info("sending generated image as photo url=%s", image_url)
-            await bot.send_photo(
-                chat_id,
-                photo=image_url,
-                caption="Готово ✨\nХочешь попробовать другой стиль или сохранить этот образ?",
-                reply_markup=result_actions_keyboard(),
+        if message.document:
+            await self._job_repo.set_result(
+                job.job_id, document_file_id=message.document.file_id
             )
-        except TelegramBadRequest as exc:
-            logging.warning("send_photo failed, falling back to document: %s", exc)
-            await self._send_file_from_url(bot, chat_id, session, image_url, as_document=True)
+        elif message.photo:
+            await self._job_repo.set_result(job.job_id, photo_file_id=message.photo[-1].file_id)
 
-    async def _should_send_as_document(
+    async def _send_preview(
         self,
+        job: GenerationJob,
         session: aiohttp.ClientSession,
         image_url: str,
-    ) -> bool:
-        if not self._telegram_photo_max_bytes:
-            return False
-        try:
-            async with session.head(image_url, allow_redirects=True) as resp:
-                if resp.status >= 400:
-                    return False
-                content_length = resp.headers.get("Content-Length")
-                if not content_length:
-                    return False
-                return int(content_length) > self._telegram_photo_max_bytes
-        except Exception:
-            logging.warning("failed to check image size for %s", image_url)
-            return False
+    ) -> Message:
+        content = await self._download_result(session, image_url)
+        stage_started = time.perf_counter()
+        preview = await self._image_processor.preview(
+            content, self._preview_max_side, self._preview_format, self._preview_quality
+        )
+        self._log_stage("preview", job.user_id, stage_started)
+        logging.info(
+            "sending generated image preview bytes=%s original=%s", len(preview), len(content)
+        )
+        return await job.bot.send_photo(
+            job.chat_id,
+            photo=BufferedInputFile(preview, filename=f"result.{self._preview_format}"),
+            caption=RESULT_CAPTION,
+            reply_markup=result_actions_keyboard(job.job_id),
+        )
 
-    async def _send_file_from_url(
+    async def _send_by_url(
         self,
-        bot: Bot,
-        chat_id: int,
+        job: GenerationJob,
         session: aiohttp.ClientSession,
         image_url: str,
-        *,
-        as_document: bool,
-    ) -> None:
-        temp_path = None
+    ) -> Message:
+        bot = job.bot
         try:
-            temp_path = await self._download_to_temp(session, image_url)
-            input_file = FSInputFile(temp_path)
-            if as_document:
-                await bot.send_document(
-                    chat_id,
+            logging.info("sending generated image as photo url=%s", image_url)
+            message = await bot.send_photo(
+                job.chat_id,
+                photo=image_url,
+                caption=RESULT_CAPTION,
+                reply_markup=result_actions_keyboard(job.job_id),
+            )
+        except TelegramBadRequest as exc:
+            logging.warning("send_photo by url failed, uploading from memory: %s", exc)
+            content = await self._download_result(session, image_url)
+            input_file = BufferedInputFile(content, filename=self._result_filename(image_url))
+            if self._telegram_photo_max_bytes and len(content) > self._telegram_photo_max_bytes:
+                message = await bot.send_document(
+                    job.chat_id,
                     document=input_file,
-                    caption="Готово ✨\nХочешь попробовать другой стиль или сохранить этот образ?",
+                    caption=RESULT_CAPTION,
                     reply_markup=result_actions_keyboard(),
                 )
             else:
-                await bot.send_photo(
-                    chat_id,
-                    photo=input_file,
-                    caption="Готово ✨\nХочешь попробовать другой стиль или сохранить этот образ?",
-                    reply_markup=result_actions_keyboard(),
-                )
-        finally:
-            if temp_path and os.path.exists(temp_path):
-                os.remove(temp_path)
+                try:
+                    message = await bot.send_photo(
+                        job.chat_id,
+                        photo=input_file,
+                        caption=RESULT_CAPTION,
+                        reply_markup=result_actions_keyboard(job.job_id),
+                    )
+                except TelegramBadRequest as exc:
+                    logging.warning("send_photo upload failed, falling back to document: %s", exc)
+                    message = await bot.send_document(
+                        job.chat_id,
+                        document=input_file,
+                        caption=RESULT_CAPTION,
+                        reply_markup=result_actions_keyboard(),
+                    )
+        return message
 
-    async def _download_to_temp(
-        self,
-        session: aiohttp.ClientSession,
-        image_url: str,
-    ) -> str:
-        suffix = Path(image_url).suffix or ".png"
-        with tempfile.NamedTemporaryFile(delete=False, suffix=suffix) as tmp:
-            temp_path = tmp.name
+    async def _download_result(self, session: aiohttp.ClientSession, image_url: str) -> bytes:
+        buffer = bytearray()
         async with session.get(image_url) as resp:
             if resp.status >= 400:
                 raise RuntimeError(f"Failed to download image: {resp.status}")
-            with open(temp_path, "wb") as file_handle:
-                while True:
-                    chunk = await resp.content.read(1024 * 64)
-                    if not chunk:
-                        break
-                    file_handle.write(chunk)
-        return temp_path
+            async for chunk in resp.content.iter_chunked(64 * 1024):
+                buffer.extend(chunk)
+                if len(buffer) > TELEGRAM_DOCUMENT_MAX_BYTES:
+                    raise RuntimeError("Generated image exceeds Telegram document limit")
+        return bytes(buffer)
+
+    @staticmethod
+    def _result_filename(image_url: str) -> str:
+        return Path(urlsplit(image_url).path).name or "result.png"
@@ -0,0 +1,69 @@
+from __future__ import annotations
+
+import asyncio
+import io
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+EXIF_ORIENTATION = 0x0112
+
+
+def make_preview(data: bytes, max_side: int, image_format: str, quality: int) -> bytes:
+    from PIL import Image
+
+    with Image.open(io.BytesIO(data)) as image:
+        image.thumbnail((max_side, max_side), Image.Resampling.LANCZOS)
+        if image_format == "jpeg" and image.mode not in {"RGB", "L"}:
+            image = image.convert("RGB")
+        output = io.BytesIO()
+        image.save(output, format=image_format.upper(), quality=quality, optimize=True)
+    return output.getvalue()
+
+
+def prepare_input(data: bytes, max_side: int, quality: int) -> bytes | None:
+    from PIL import Image, ImageOps
+
+    with Image.open(io.BytesIO(data)) as source:
+        rotated = source.getexif().get(EXIF_ORIENTATION, 1) != 1
+        resized = max(source.size) > max_side
+        if not rotated and not resized and source.format == "JPEG":
+            return None
+        image = ImageOps.exif_transpose(source)
+        image.thumbnail((max_side, max_side), Image.Resampling.LANCZOS)
+        if image.mode not in {"RGB", "L"}:
+            image = image.convert("RGB")
+        output = io.BytesIO()
+        image.save(output, format="JPEG", quality=quality, optimize=True)
+    prepared = output.getvalue()
+    if not rotated and not resized and len(prepared) >= len(data):
+        return None
+    return prepared
+
+
+class ImageProcessor:
+    def __init__(self, workers: int = 2) -> None:
+        try:
+            import PIL  # noqa: F401
+        except ImportError as exc:
+            raise RuntimeError("Image processing requires the 'Pillow' package") from exc
+        # Forking a process that already runs aiosqlite and resolver threads can deadlock.
+        self._executor = ProcessPoolExecutor(
+            max_workers=max(1, workers), mp_context=multiprocessing.get_context("spawn")
+        )
+
+    async def preview(
+        self, data: bytes, max_side: int, image_format: str = "jpeg", quality: int = 85
+    ) -> bytes:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            self._executor, make_preview, data, max_side, image_format, quality
+        )
+
+    async def prepare_input(self, data: bytes, max_side: int, quality: int = 90) -> bytes | None:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            self._executor, prepare_input, data, max_side, quality
+        )
+
+    def close(self) -> None:
+        self._executor.shutdown(wait=False, cancel_futures=True)
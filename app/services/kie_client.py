@@ -1,13 +1,15 @@
 from __future__ import annotations
 
-import asyncio
+import json
 import logging
-import os
+import mimetypes
 from dataclasses import dataclass
-from typing import Any
+from typing import Any, AsyncIterable
 
 import aiohttp
 
+from app.metrics import track_api
+
 
 @dataclass(slots=True)
 class KieTaskResult:
@@ -25,8 +27,11 @@ class KieClient:
         resolution: str,
         aspect_ratio: str,
         output_format: str,
-        poll_interval_seconds: int,
-        max_poll_seconds: int,
+        connection_limit: int = 100,
+        connection_limit_per_host: int = 20,
+        dns_cache_ttl_seconds: int = 300,
+        keepalive_seconds: int = 60,
+        timeout_seconds: int = 60,
     ) -> None:
         self._api_key = api_key
         self._api_base_url = api_base_url.rstrip("/")
@@ -35,40 +40,95 @@ class KieClient:
         self._resolution = resolution
         self._aspect_ratio = aspect_ratio
         self._output_format = output_format
-        self._poll_interval_seconds = poll_interval_seconds
-        self._max_poll_seconds = max_poll_seconds
+        self._connection_limit = connection_limit
+        self._connection_limit_per_host = connection_limit_per_host
+        self._dns_cache_ttl_seconds = dns_cache_ttl_seconds
+        self._keepalive_seconds = keepalive_seconds
+        self._timeout_seconds = timeout_seconds
+        self._session: aiohttp.ClientSession | None = None
+        self._connections_created = 0
+        self._connections_reused = 0
+
+    @property
+    def session(self) -> aiohttp.ClientSession:
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(
+                limit=self._connection_limit,
+                limit_per_host=self._connection_limit_per_host,
+                ttl_dns_cache=self._dns_cache_ttl_seconds,
+                keepalive_timeout=self._keepalive_seconds,
+            )
+            trace_config = aiohttp.TraceConfig()
+            trace_config.on_connection_create_end.append(self._on_connection_created)
+            trace_config.on_connection_reuseconn.append(self._on_connection_reused)
+            # No total limit: uploads and 4K result downloads can legitimately take long,
+            # but a stalled connect or read must not hang a worker for minutes.
+            timeout = aiohttp.ClientTimeout(
+                total=None,
+                sock_connect=self._timeout_seconds,
+                sock_read=self._timeout_seconds,
+            )
+            self._session = aiohttp.ClientSession(
+                connector=connector,
+                timeout=timeout,
+                trace_configs=[trace_config],
+            )
+        return self._session
+
+    def connection_stats(self) -> tuple[int, int]:
+        return self._connections_created, self._connections_reused
+
+    async def close(self) -> None:
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
+
+    async def _on_connection_created(self, *_: Any) -> None:
+        self._connections_created += 1
+
+    async def _on_connection_reused(self, *_: Any) -> None:
+        self._connections_reused += 1
 
     def _headers(self) -> dict[str, str]:
         return {"Authorization": f"Bearer {self._api_key}"}
 
-    async def upload_file(self, session: aiohttp.ClientSession, path: str, upload_path: str) -> str:
+    async def upload_file(
+        self,
+        content: bytes | AsyncIterable[bytes],
+        filename: str,
+        upload_path: str,
+    ) -> str:
         url = f"{self._file_base_url}/api/file-stream-upload"
-        filename = os.path.basename(path)
         form = aiohttp.FormData()
         form.add_field("uploadPath", upload_path)
         form.add_field("fileName", filename)
-        with open(path, "rb") as file_handle:
-            form.add_field("file", file_handle, filename=filename)
-            async with session.post(url, data=form, headers=self._headers()) as resp:
+        form.add_field(
+            "file",
+            content,
+            filename=filename,
+            content_type=mimetypes.guess_type(filename)[0] or "application/octet-stream",
+        )
+        with track_api("kie", "upload"):
+            async with self.session.post(url, data=form, headers=self._headers()) as resp:
                 data = await resp.json()
                 if resp.status >= 400:
                     logging.warning("kie upload failed: %s %s", resp.status, data)
                     raise RuntimeError(f"Kie upload failed: {resp.status} {data}")
-                file_url = (
-                    data.get("data", {}).get("downloadUrl")
-                    or data.get("data", {}).get("fileUrl")
-                    or data.get("data", {}).get("url")
-                )
-                if not file_url:
-                    logging.warning("kie upload missing url: %s", data)
-                    raise RuntimeError(f"Kie upload missing file URL: {data}")
-                return str(file_url)
+        file_url = (
+            data.get("data", {}).get("downloadUrl")
+            or data.get("data", {}).get("fileUrl")
+            or data.get("data", {}).get("url")
+        )
+        if not file_url:
+            logging.warning("kie upload missing url: %s", data)
+            raise RuntimeError(f"Kie upload missing file URL: {data}")
+        return str(file_url)
 
     async def create_task(
         self,
-        session: aiohttp.ClientSession,
         prompt: str,
         image_urls: list[str],
+        callback_url: str | None = None,
     ) -> str:
         url = f"{self._api_base_url}/api/v1/jobs/createTask"
         payload = {
@@ -82,72 +142,74 @@ class KieClient:
             },
             "config": {"service_mode": "public"},
         }
-        async with session.post(url, json=payload, headers=self._headers()) as resp:
-            data = await resp.json()
-            if resp.status >= 400:
-                logging.warning("kie createTask failed: %s %s", resp.status, data)
-                raise RuntimeError(f"Kie createTask failed: {resp.status} {data}")
-            task_id = data.get("data", {}).get("taskId")
-            if not task_id:
-                logging.warning("kie createTask missing taskId: %s", data)
-                raise RuntimeError(f"Kie createTask missing taskId: {data}")
-            return str(task_id)
-
-    async def get_task(self, session: aiohttp.ClientSession, task_id: str) -> dict[str, Any]:
+        if callback_url:
+            payload["callBackUrl"] = callback_url
+        with track_api("kie", "createTask"):
+            async with self.session.post(url, json=payload, headers=self._headers()) as resp:
+                data = await resp.json()
+                if resp.status >= 400:
+                    logging.warning("kie createTask failed: %s %s", resp.status, data)
+                    raise RuntimeError(f"Kie createTask failed: {resp.status} {data}")
+        task_id = data.get("data", {}).get("taskId")
+        if not task_id:
+            logging.warning("kie createTask missing taskId: %s", data)
+            raise RuntimeError(f"Kie createTask missing taskId: {data}")
+        return str(task_id)
+
+    async def get_task(self, task_id: str) -> dict[str, Any]:
         url = f"{self._api_base_url}/api/v1/jobs/recordInfo"
-        async with session.get(url, params={"taskId": task_id}, headers=self._headers()) as resp:
-            data = await resp.json()
-            if resp.status >= 400:
-                logging.warning("kie recordInfo failed: %s %s", resp.status, data)
-                raise RuntimeError(f"Kie recordInfo failed: {resp.status} {data}")
-            return data
-
-    async def poll_task(self, session: aiohttp.ClientSession, task_id: str) -> KieTaskResult:
-        elapsed = 0
-        while elapsed <= self._max_poll_seconds:
-            data = await self.get_task(session, task_id)
-            task_data = data.get("data", {})
-            status = str(task_data.get("state") or task_data.get("status") or "")
-            if status.lower() in {"success", "succeeded", "complete", "completed"}:
-                result_json = task_data.get("resultJson") or {}
-                parsed_urls: list[str] | list[Any] = []
-                if isinstance(result_json, str):
-                    try:
-                        import json
-
-                        parsed = json.loads(result_json)
-                        if isinstance(parsed, dict):
-                            result_json = parsed
-                        elif isinstance(parsed, list):
-                            parsed_urls = parsed
-                            result_json = {}
-                        else:
-                            result_json = {}
-                    except Exception:
-                        logging.warning("kie resultJson is not json: %s", result_json)
+        with track_api("kie", "recordInfo"):
+            async with self.session.get(
+                url,
+                params={"taskId": task_id},
+                headers=self._headers(),
+                timeout=aiohttp.ClientTimeout(total=self._timeout_seconds),
+            ) as resp:
+                data = await resp.json()
+                if resp.status >= 400:
+                    logging.warning("kie recordInfo failed: %s %s", resp.status, data)
+                    raise RuntimeError(f"Kie recordInfo failed: {resp.status} {data}")
+                return data
+
+    def parse_task(self, data: dict[str, Any]) -> KieTaskResult | None:
+        task_data = data.get("data", {}) or {}
+        status = str(task_data.get("state") or task_data.get("status") or "")
+        if status.lower() in {"success", "succeeded", "complete", "completed"}:
+            result_json = task_data.get("resultJson") or {}
+            parsed_urls: list[str] | list[Any] = []
+            if isinstance(result_json, str):
+                try:
+                    parsed = json.loads(result_json)
+                    if isinstance(parsed, dict):
+                        result_json = parsed
+                    elif isinstance(parsed, list):
+                        parsed_urls = parsed
+                        result_json = {}
+                    else:
                         result_json = {}
-                if not isinstance(result_json, dict):
-                    logging.warning("kie resultJson unexpected type: %s", type(result_json))
+                except Exception:
+                    logging.warning("kie resultJson is not json: %s", result_json)
                     result_json = {}
-                image_urls = (
-                    result_json.get("resultUrls")
-                    or result_json.get("result_urls")
-                    or result_json.get("images")
-                    or task_data.get("resultUrls")
-                    or task_data.get("result_urls")
-                    or []
-                )
-                if not image_urls and parsed_urls:
-                    image_urls = parsed_urls
-                if isinstance(image_urls, str):
-                    image_urls = [image_urls]
-                elif isinstance(image_urls, tuple):
-                    image_urls = list(image_urls)
-                elif not isinstance(image_urls, list):
-                    image_urls = [str(image_urls)]
-                return KieTaskResult(status=status, image_urls=list(image_urls))
-            if status.lower() in {"failed", "error", "canceled", "cancelled"}:
-                return KieTaskResult(status=status, image_urls=[])
-            await asyncio.sleep(self._poll_interval_seconds)
-            elapsed += self._poll_interval_seconds
-        return KieTaskResult(status="timeout", image_urls=[])
+            if not isinstance(result_json, dict):
+                logging.warning("kie resultJson unexpected type: %s", type(result_json))
+                result_json = {}
+            image_urls = (
+                result_json.get("resultUrls")
+                or result_json.get("result_urls")
+                or result_json.get("images")
+                or task_data.get("resultUrls")
+                or task_data.get("result_urls")
+                or []
+            )
+            if not image_urls and parsed_urls:
+                image_urls = parsed_urls
+            if isinstance(image_urls, str):
+                image_urls = [image_urls]
+            elif isinstance(image_urls, tuple):
+                image_urls = list(image_urls)
+            elif not isinstance(image_urls, list):
+                image_urls = [str(image_urls)]
+            return KieTaskResult(status=status, image_urls=list(image_urls))
+        if status.lower() in {"failed", "error", "canceled", "cancelled"}:
+            return KieTaskResult(status=status, image_urls=[])
+        return None
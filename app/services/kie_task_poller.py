@@ -0,0 +1,180 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+import random
+from dataclasses import dataclass
+from typing import Any
+
+from app.repositories.kie_results import KieResultRepo
+from app.services.kie_client import KieClient, KieTaskResult
+
+
+@dataclass(slots=True)
+class _TrackedTask:
+    future: asyncio.Future[KieTaskResult]
+    deadline: float
+    next_check_at: float
+    interval: float
+    waiters: int = 0
+    checking: bool = False
+
+
+class KieTaskPoller:
+    def __init__(
+        self,
+        kie_client: KieClient,
+        min_interval_seconds: float,
+        max_interval_seconds: float,
+        max_wait_seconds: float,
+        concurrency: int = 20,
+        backoff: float = 1.5,
+        jitter: float = 0.2,
+        results: KieResultRepo | None = None,
+        shared_check_seconds: float = 1.0,
+    ) -> None:
+        self._kie_client = kie_client
+        self._min_interval_seconds = min_interval_seconds
+        self._max_interval_seconds = max(min_interval_seconds, max_interval_seconds)
+        self._max_wait_seconds = max_wait_seconds
+        self._semaphore = asyncio.Semaphore(max(1, concurrency))
+        self._backoff = backoff
+        self._jitter = jitter
+        self._tasks: dict[str, _TrackedTask] = {}
+        # Callbacks may reach another webhook worker, or arrive before wait() registers the
+        # task. Such results go through the database and are picked up by the owner.
+        self._results = results
+        self._shared_check_seconds = shared_check_seconds
+        self._next_shared_check_at = 0.0
+        self._shared_checking = False
+        self._checks: set[asyncio.Task] = set()
+        self._wakeup = asyncio.Event()
+
+    @property
+    def in_flight(self) -> int:
+        return len(self._tasks)
+
+    async def wait(self, task_id: str) -> KieTaskResult:
+        loop = asyncio.get_running_loop()
+        tracked = self._tasks.get(task_id)
+        if tracked is None:
+            now = loop.time()
+            tracked = _TrackedTask(
+                future=loop.create_future(),
+                deadline=now + self._max_wait_seconds,
+                next_check_at=now + self._min_interval_seconds,
+                interval=self._min_interval_seconds,
+            )
+            self._tasks[task_id] = tracked
+            self._wakeup.set()
+        tracked.waiters += 1
+        try:
+            # Shielded so that one cancelled waiter does not cancel the result for the others.
+            return await asyncio.shield(tracked.future)
+        except asyncio.CancelledError:
+            if tracked.waiters == 1 and self._tasks.get(task_id) is tracked:
+                del self._tasks[task_id]
+            raise
+        finally:
+            tracked.waiters -= 1
+
+    async def run(self) -> None:
+        loop = asyncio.get_running_loop()
+        try:
+            while True:
+                self._wakeup.clear()
+                now = loop.time()
+                pending = []
+                for task_id, tracked in self._tasks.items():
+                    if tracked.checking or tracked.future.done():
+                        continue
+                    if tracked.next_check_at <= now:
+                        tracked.checking = True
+                        check = asyncio.create_task(self._check(task_id, tracked))
+                        self._checks.add(check)
+                        check.add_done_callback(self._checks.discard)
+                    else:
+                        pending.append(tracked.next_check_at)
+                if self._results is not None and self._tasks and not self._shared_checking:
+                    if self._next_shared_check_at <= now:
+                        self._shared_checking = True
+                        check = asyncio.create_task(self._check_shared())
+                        self._checks.add(check)
+                        check.add_done_callback(self._checks.discard)
+                    else:
+                        pending.append(self._next_shared_check_at)
+                timeout = max(0.0, min(pending) - now) if pending else None
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=timeout)
+                except asyncio.TimeoutError:
+                    pass
+        finally:
+            for check in self._checks:
+                check.cancel()
+
+    async def _check(self, task_id: str, tracked: _TrackedTask) -> None:
+        try:
+            await self._check_once(task_id, tracked)
+        finally:
+            tracked.checking = False
+            self._wakeup.set()
+
+    async def _check_shared(self) -> None:
+        loop = asyncio.get_running_loop()
+        try:
+            task_ids = [
+                task_id for task_id, tracked in self._tasks.items() if not tracked.future.done()
+            ]
+            found = await self._results.find(task_ids)
+            for task_id, (status, image_urls) in found.items():
+                self._resolve(task_id, KieTaskResult(status=status, image_urls=image_urls))
+            await self._results.delete(list(found))
+        except Exception:
+            logging.exception("kie shared result check failed")
+        finally:
+            self._shared_checking = False
+            self._next_shared_check_at = loop.time() + self._shared_check_seconds
+            self._wakeup.set()
+
+    async def _check_once(self, task_id: str, tracked: _TrackedTask) -> None:
+        loop = asyncio.get_running_loop()
+        result = None
+        async with self._semaphore:
+            try:
+                data = await self._kie_client.get_task(task_id)
+                result = self._kie_client.parse_task(data)
+            except Exception:
+                logging.warning("kie task poll failed task_id=%s", task_id)
+        if result is not None:
+            self._resolve(task_id, result)
+            return
+        now = loop.time()
+        if now >= tracked.deadline:
+            logging.warning("kie task timed out task_id=%s", task_id)
+            self._resolve(task_id, KieTaskResult(status="timeout", image_urls=[]))
+            return
+        tracked.interval = min(tracked.interval * self._backoff, self._max_interval_seconds)
+        delay = tracked.interval * random.uniform(1 - self._jitter, 1 + self._jitter)
+        tracked.next_check_at = min(now + delay, tracked.deadline)
+
+    async def resolve(self, data: dict[str, Any]) -> bool:
+        task_data = data.get("data") or {}
+        task_id = str(task_data.get("taskId") or "")
+        if not task_id:
+            return False
+        result = self._kie_client.parse_task(data)
+        if result is None:
+            return False
+        if task_id in self._tasks:
+            self._resolve(task_id, result)
+            return True
+        if self._results is not None:
+            await self._results.save(
+                task_id, result.status, result.image_urls, keep_seconds=self._max_wait_seconds
+            )
+        return False
+
+    def _resolve(self, task_id: str, result: KieTaskResult) -> None:
+        tracked = self._tasks.pop(task_id, None)
+        if tracked is not None and not tracked.future.done():
+            tracked.future.set_result(result)
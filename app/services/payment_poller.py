@@ -0,0 +1,126 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+import time
+from dataclasses import dataclass
+
+from aiogram import Bot
+
+from app.metrics import PAYMENTS_PENDING
+from app.repositories.payments import PaymentRepo
+from app.services.payment_service import PaymentService
+from app.services.yookassa_service import YooKassaService
+
+
+@dataclass(slots=True)
+class _PollSchedule:
+    next_check_at: float
+    attempts: int = 0
+
+
+class PaymentPoller:
+    def __init__(
+        self,
+        payment_repo: PaymentRepo,
+        yookassa_service: YooKassaService,
+        payment_service: PaymentService,
+        interval_seconds: int,
+        concurrency: int,
+        max_backoff_seconds: int,
+        request_timeout_seconds: int,
+        pending_ttl_seconds: int,
+        archive_after_days: int,
+        archive_every_seconds: int = 3600,
+    ) -> None:
+        self._payment_repo = payment_repo
+        self._yookassa_service = yookassa_service
+        self._payment_service = payment_service
+        self._interval_seconds = interval_seconds
+        self._semaphore = asyncio.Semaphore(max(1, concurrency))
+        self._max_backoff_seconds = max(interval_seconds, max_backoff_seconds)
+        self._request_timeout_seconds = request_timeout_seconds
+        self._schedule: dict[str, _PollSchedule] = {}
+        self._pending_ttl_seconds = pending_ttl_seconds
+        self._archive_after_days = archive_after_days
+        self._archive_every_seconds = archive_every_seconds
+        self._next_archive_at = 0.0
+
+    async def run(self, bot: Bot) -> None:
+        while True:
+            started = time.monotonic()
+            try:
+                await self.sweep(bot)
+            except Exception:
+                logging.exception("payment poll sweep failed")
+            elapsed = time.monotonic() - started
+            await asyncio.sleep(max(0.0, self._interval_seconds - elapsed))
+
+    async def sweep(self, bot: Bot) -> None:
+        await self._maintain()
+        pending = await self._payment_repo.list_pending()
+        PAYMENTS_PENDING.set(len(pending))
+        now = time.monotonic()
+        live_ids = {payment_record["payment_id"] for payment_record in pending}
+        for payment_id in list(self._schedule):
+            if payment_id not in live_ids:
+                del self._schedule[payment_id]
+
+        due = []
+        for payment_record in pending:
+            schedule = self._schedule.setdefault(
+                payment_record["payment_id"], _PollSchedule(next_check_at=now)
+            )
+            if schedule.next_check_at <= now:
+                due.append(payment_record)
+        if not due:
+            return
+        started = time.monotonic()
+        await asyncio.gather(*(self._check(bot, payment_record, now) for payment_record in due))
+        logging.info(
+            "payment poll sweep pending=%s checked=%s took=%.2fs",
+            len(pending),
+            len(due),
+            time.monotonic() - started,
+        )
+
+    async def _maintain(self) -> None:
+        expired = await self._payment_repo.expire_stale(self._pending_ttl_seconds)
+        if expired:
+            logging.info("expired stale pending payments count=%s", expired)
+        now = time.monotonic()
+        if now < self._next_archive_at:
+            return
+        self._next_archive_at = now + self._archive_every_seconds
+        archived = await self._payment_repo.archive_settled(self._archive_after_days)
+        if archived:
+            logging.info("archived settled payments count=%s", archived)
+
+    async def _check(self, bot: Bot, payment_record: dict, swept_at: float) -> None:
+        payment_id = payment_record["payment_id"]
+        async with self._semaphore:
+            try:
+                payment = await asyncio.wait_for(
+                    self._yookassa_service.fetch_payment(payment_id),
+                    timeout=self._request_timeout_seconds,
+                )
+            except Exception:
+                logging.warning("payment poll failed payment_id=%s", payment_id)
+                self._reschedule(payment_id, swept_at)
+                return
+        status = payment.get("status")
+        credited = await self._payment_service.apply_status(payment_record, status)
+        if credited:
+            await self._payment_service.notify_success(bot, int(payment_record["user_id"]))
+        if status == "succeeded":
+            self._schedule.pop(payment_id, None)
+            return
+        self._reschedule(payment_id, swept_at)
+
+    def _reschedule(self, payment_id: str, swept_at: float) -> None:
+        schedule = self._schedule.get(payment_id)
+        if schedule is None:
+            return
+        delay = min(self._interval_seconds * 2**schedule.attempts, self._max_backoff_seconds)
+        schedule.attempts += 1
+        schedule.next_check_at = swept_at + delay
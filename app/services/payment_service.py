@@ -0,0 +1,42 @@
+from __future__ import annotations
+
+import logging
+
+from aiogram import Bot
+from aiogram.exceptions import TelegramForbiddenError
+
+from app.repositories.payments import PaymentRepo
+from app.services.balance_service import BalanceService
+
+PAYMENT_SUCCESS_TEXT = (
+    "Оплата прошла успешно\n\n"
+    "Генерации уже доступны.\n"
+    "Можем продолжать создавать образы."
+)
+
+
+class PaymentService:
+    def __init__(self, payment_repo: PaymentRepo, balance_service: BalanceService) -> None:
+        self._payment_repo = payment_repo
+        self._balance_service = balance_service
+
+    async def apply_status(self, payment_record: dict, status: str | None) -> bool:
+        payment_id = payment_record["payment_id"]
+        if status == "succeeded":
+            updated = await self._payment_repo.mark_succeeded(payment_id)
+            if not updated:
+                return False
+            user_id = int(payment_record["user_id"])
+            generations = int(payment_record["generations"])
+            await self._balance_service.add_generations(user_id, generations)
+            logging.info("payment credited payment_id=%s user=%s", payment_id, user_id)
+            return True
+        if status and status != payment_record.get("status"):
+            await self._payment_repo.update_status(payment_id, status)
+        return False
+
+    async def notify_success(self, bot: Bot, user_id: int) -> None:
+        try:
+            await bot.send_message(user_id, PAYMENT_SUCCESS_TEXT)
+        except TelegramForbiddenError as exc:
+            logging.warning("payment notify forbidden for user=%s: %s", user_id, exc)
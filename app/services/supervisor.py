@@ -0,0 +1,57 @@
+from __future__ import annotations
+
+import asyncio
+import contextlib
+import logging
+import signal
+from typing import Coroutine
+
+
+class TaskSupervisor:
+    def __init__(self) -> None:
+        self._tasks: set[asyncio.Task] = set()
+        self._stopping = asyncio.Event()
+
+    @property
+    def stopping(self) -> bool:
+        return self._stopping.is_set()
+
+    def spawn(self, coro: Coroutine, name: str, *, critical: bool = False) -> asyncio.Task:
+        task = asyncio.create_task(coro, name=name)
+        self._tasks.add(task)
+        task.add_done_callback(self._on_done)
+        if critical:
+            task.add_done_callback(lambda _: self.request_stop())
+        return task
+
+    def install_signal_handlers(self) -> None:
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGTERM, signal.SIGINT):
+            with contextlib.suppress(NotImplementedError):
+                loop.add_signal_handler(sig, self.request_stop, sig)
+
+    def request_stop(self, sig: signal.Signals | None = None) -> None:
+        if not self._stopping.is_set():
+            logging.info("shutdown requested signal=%s", sig.name if sig else None)
+        self._stopping.set()
+
+    async def wait_stopped(self) -> None:
+        await self._stopping.wait()
+
+    async def shutdown(self, timeout: float) -> None:
+        tasks = list(self._tasks)
+        for task in tasks:
+            task.cancel()
+        if not tasks:
+            return
+        _, pending = await asyncio.wait(tasks, timeout=timeout)
+        for task in pending:
+            logging.warning("background task did not stop in time name=%s", task.get_name())
+
+    def _on_done(self, task: asyncio.Task) -> None:
+        self._tasks.discard(task)
+        if task.cancelled():
+            return
+        exc = task.exception()
+        if exc is not None:
+            logging.error("background task failed name=%s", task.get_name(), exc_info=exc)
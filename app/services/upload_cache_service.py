@@ -0,0 +1,43 @@
+from __future__ import annotations
+
+import logging
+
+from app.repositories.uploads import UploadCacheRepo
+
+
+class UploadCacheService:
+    def __init__(
+        self,
+        repo: UploadCacheRepo,
+        ttl_seconds: int,
+        max_entries: int,
+        evict_every_puts: int = 100,
+    ) -> None:
+        self._repo = repo
+        self._ttl_seconds = ttl_seconds
+        self._max_entries = max_entries
+        self._evict_every_puts = evict_every_puts
+        self._puts = 0
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def hit_ratio(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    async def get_url(self, file_unique_id: str) -> str | None:
+        url = await self._repo.get_url(file_unique_id, self._ttl_seconds)
+        if url:
+            self.hits += 1
+        else:
+            self.misses += 1
+        return url
+
+    async def put_url(self, file_unique_id: str, url: str) -> None:
+        await self._repo.put_url(file_unique_id, url)
+        self._puts += 1
+        if self._puts % self._evict_every_puts == 0:
+            evicted = await self._repo.evict(self._ttl_seconds, self._max_entries)
+            if evicted:
+                logging.info("upload cache evicted count=%s", evicted)
@@ -1,33 +1,115 @@
 from __future__ import annotations
 
 import asyncio
+import json
 import logging
 import uuid
 from typing import Any
 
-from yookassa import Configuration, Payment
+import aiohttp
 
+from app.metrics import track_api
 
-def _payment_to_dict(payment: Any) -> dict[str, Any]:
-    if isinstance(payment, dict):
-        return payment
+
+class _RetryableError(Exception):
+    pass
+
+
+def _parse_json(body: str) -> Any | None:
+    if not body:
+        return None
     try:
-        return dict(payment)
-    except Exception:
-        pass
-    data: dict[str, Any] = {}
-    for key in ("id", "status", "metadata", "confirmation", "amount", "description"):
-        value = getattr(payment, key, None)
-        if value is not None:
-            data[key] = value
-    return data
+        return json.loads(body)
+    except ValueError:
+        return None
 
 
 class YooKassaService:
-    def __init__(self, shop_id: str, secret_key: str, return_url: str) -> None:
-        Configuration.account_id = shop_id
-        Configuration.secret_key = secret_key
+    def __init__(
+        self,
+        shop_id: str,
+        secret_key: str,
+        return_url: str,
+        api_base_url: str = "https://api.yookassa.ru/v3",
+        timeout_seconds: int = 10,
+        max_connections: int = 50,
+        retries: int = 2,
+    ) -> None:
+        self._auth = aiohttp.BasicAuth(shop_id, secret_key)
         self._return_url = return_url
+        self._api_base_url = api_base_url.rstrip("/")
+        self._timeout = aiohttp.ClientTimeout(total=timeout_seconds)
+        self._max_connections = max_connections
+        self._retries = retries
+        self._session: aiohttp.ClientSession | None = None
+
+    def _get_session(self) -> aiohttp.ClientSession:
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(
+                limit=self._max_connections,
+                ttl_dns_cache=300,
+                keepalive_timeout=60,
+            )
+            self._session = aiohttp.ClientSession(
+                connector=connector,
+                auth=self._auth,
+                timeout=self._timeout,
+            )
+        return self._session
+
+    async def close(self) -> None:
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
+
+    async def _request(
+        self,
+        method: str,
+        path: str,
+        *,
+        payload: dict[str, Any] | None = None,
+        idempotence_key: str | None = None,
+    ) -> dict[str, Any]:
+        url = f"{self._api_base_url}{path}"
+        headers = {"Idempotence-Key": idempotence_key} if idempotence_key else None
+        session = self._get_session()
+        operation = f"{method} /{path.strip('/').split('/')[0]}"
+        attempt = 0
+        while True:
+            try:
+                with track_api("yookassa", operation):
+                    async with session.request(
+                        method, url, json=payload, headers=headers
+                    ) as resp:
+                        body = await resp.text()
+                        data = _parse_json(body)
+                        details = data if data is not None else body[:200]
+                        if resp.status == 202 or resp.status >= 500:
+                            raise _RetryableError(
+                                f"YooKassa {method} {path}: {resp.status} {details}"
+                            )
+                        if resp.status >= 400:
+                            logging.warning(
+                                "yookassa %s %s failed: %s %s", method, path, resp.status, details
+                            )
+                            raise RuntimeError(
+                                f"YooKassa {method} {path} failed: {resp.status} {details}"
+                            )
+                        if body and not isinstance(data, dict):
+                            logging.warning(
+                                "yookassa %s %s returned non-JSON body: %s",
+                                method,
+                                path,
+                                details,
+                            )
+                            raise RuntimeError(f"YooKassa {method} {path} returned non-JSON body")
+                        return data or {}
+            except (_RetryableError, aiohttp.ClientError, asyncio.TimeoutError) as exc:
+                if attempt >= self._retries:
+                    logging.warning("yookassa %s %s giving up: %s", method, path, exc)
+                    raise RuntimeError(f"YooKassa {method} {path} failed: {exc}") from exc
+                attempt += 1
+                await asyncio.sleep(0.5 * 2**attempt)
 
     async def create_payment(
         self,
@@ -45,24 +127,9 @@ class YooKassaService:
             "description": description,
             "metadata": {"user_id": str(user_id), "generations": str(generations)},
         }
-
-        def _create() -> dict[str, Any]:
-            try:
-                payment = Payment.create(payload, idempotence_key)
-                return _payment_to_dict(payment)
-            except Exception:
-                logging.exception("YooKassa create_payment failed")
-                raise
-
-        return await asyncio.to_thread(_create)
+        return await self._request(
+            "POST", "/payments", payload=payload, idempotence_key=idempotence_key
+        )
 
     async def fetch_payment(self, payment_id: str) -> dict[str, Any]:
-        def _fetch() -> dict[str, Any]:
-            try:
-                payment = Payment.find_one(payment_id)
-                return _payment_to_dict(payment)
-            except Exception:
-                logging.exception("YooKassa fetch_payment failed: %s", payment_id)
-                raise
-
-        return await asyncio.to_thread(_fetch)
+        return await self._request("GET", f"/payments/{payment_id}")
@@ -0,0 +1,33 @@
+from __future__ import annotations
+
+import hmac
+import logging
+from typing import Awaitable, Callable
+
+from aiohttp import web
+
+from app.services.kie_task_poller import KieTaskPoller
+
+
+def kie_callback_handler(
+    task_poller: KieTaskPoller, secret: str
+) -> Callable[[web.Request], Awaitable[web.Response]]:
+    async def handle(request: web.Request) -> web.Response:
+        token = request.query.get("token", "")
+        if not hmac.compare_digest(token, secret):
+            return web.Response(status=401)
+        try:
+            body = await request.json()
+        except ValueError:
+            return web.Response(status=400)
+        if not isinstance(body, dict):
+            return web.Response(status=400)
+        resolved = await task_poller.resolve(body)
+        logging.info(
+            "kie callback task_id=%s resolved=%s",
+            (body.get("data") or {}).get("taskId"),
+            resolved,
+        )
+        return web.json_response({"status": "ok"})
+
+    return handle
@@ -0,0 +1,19 @@
+from __future__ import annotations
+
+from typing import Awaitable, Callable
+
+from aiohttp import web
+
+from app.metrics import REGISTRY
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def metrics_handler() -> Callable[[web.Request], Awaitable[web.Response]]:
+    async def handle(request: web.Request) -> web.Response:
+        return web.Response(
+            body=REGISTRY.render().encode(),
+            headers={"Content-Type": CONTENT_TYPE},
+        )
+
+    return handle
@@ -0,0 +1,51 @@
+from __future__ import annotations
+
+import logging
+
+from aiogram import Bot, Dispatcher
+from aiogram.webhook.aiohttp_server import SimpleRequestHandler, setup_application
+from aiohttp import web
+
+from app.bot.handlers import AppContext
+from app.web.kie import kie_callback_handler
+from app.web.metrics import metrics_handler
+from app.web.yookassa import yookassa_webhook_handler
+
+
+def build_web_app(
+    ctx: AppContext, bot: Bot, dp: Dispatcher | None = None
+) -> web.Application:
+    app = web.Application()
+    settings = ctx.settings
+    if dp is not None:
+        SimpleRequestHandler(
+            dispatcher=dp,
+            bot=bot,
+            secret_token=settings.telegram_webhook_secret,
+        ).register(app, path=settings.telegram_webhook_path)
+        setup_application(app, dp, bot=bot)
+    if settings.yookassa_webhook_enabled:
+        app.router.add_post(settings.yookassa_webhook_path, yookassa_webhook_handler(ctx, bot))
+    if settings.kie_callback_enabled:
+        app.router.add_post(
+            settings.kie_callback_path,
+            kie_callback_handler(ctx.kie_task_poller, settings.kie_callback_secret),
+        )
+    return app
+
+
+def build_metrics_app(path: str) -> web.Application:
+    app = web.Application()
+    app.router.add_get(path, metrics_handler())
+    return app
+
+
+async def start_web_server(
+    app: web.Application, host: str, port: int, *, reuse_port: bool = False
+) -> web.AppRunner:
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, host, port, reuse_port=reuse_port or None)
+    await site.start()
+    logging.info("web server listening on %s:%s", host, port)
+    return runner
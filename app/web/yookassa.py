@@ -0,0 +1,49 @@
+from __future__ import annotations
+
+import logging
+from typing import Awaitable, Callable
+
+from aiogram import Bot
+from aiohttp import web
+
+from app.bot.handlers import AppContext
+
+
+def yookassa_webhook_handler(
+    ctx: AppContext, bot: Bot
+) -> Callable[[web.Request], Awaitable[web.Response]]:
+    async def handle(request: web.Request) -> web.Response:
+        try:
+            body = await request.json()
+        except ValueError:
+            return web.Response(status=400)
+        if not isinstance(body, dict):
+            return web.Response(status=400)
+        event = str(body.get("event") or "")
+        payment_object = body.get("object") or {}
+        payment_id = payment_object.get("id") if isinstance(payment_object, dict) else None
+        if not event.startswith("payment.") or not payment_id:
+            return web.Response(status=200)
+
+        payment_record = await ctx.payment_repo.get_payment(str(payment_id))
+        if not payment_record:
+            logging.info("yookassa webhook for unknown payment_id=%s", payment_id)
+            return web.Response(status=200)
+        try:
+            payment = await ctx.yookassa_service.fetch_payment(str(payment_id))
+        except Exception:
+            logging.warning("yookassa webhook verify failed payment_id=%s", payment_id)
+            return web.Response(status=503)
+
+        logging.info(
+            "yookassa webhook event=%s payment_id=%s status=%s",
+            event,
+            payment_id,
+            payment.get("status"),
+        )
+        credited = await ctx.payment_service.apply_status(payment_record, payment.get("status"))
+        if credited:
+            await ctx.payment_service.notify_success(bot, int(payment_record["user_id"]))
+        return web.Response(status=200)
+
+    return handle
@@ -0,0 +1,24 @@
+from __future__ import annotations
+
+from contextlib import asynccontextmanager
+from pathlib import Path
+from typing import AsyncIterator, Callable
+
+import pytest
+
+from app.db import Database, init_db
+
+
+@pytest.fixture
+def open_database(tmp_path: Path) -> Callable[[], AsyncIterator[Database]]:
+    @asynccontextmanager
+    async def factory() -> AsyncIterator[Database]:
+        database = Database(str(tmp_path / "bot.db"), readers=2)
+        await database.connect()
+        try:
+            await init_db(database)
+            yield database
+        finally:
+            await database.close()
+
+    return factory
@@ -0,0 +1,335 @@
+from __future__ import annotations
+
+import asyncio
+from types import SimpleNamespace
+
+from app.bot.handlers import _start_generation
+from app.repositories.jobs import JobRepo
+from app.repositories.locks import LockRepo
+from app.repositories.users import UserRepo
+from app.services.balance_service import BalanceService
+from app.services.generation_service import (
+    GenerationBusyError,
+    GenerationJob,
+    GenerationService,
+    InputPhoto,
+)
+from app.services.kie_client import KieTaskResult
+
+USER_ID = 100
+CHAT_ID = 200
+INPUT_URLS = ["https://kie/input.jpg"]
+FINISHED_STATES = {"done", "failed"}
+
+
+class FakeKieClient:
+    session = None
+
+    def __init__(self) -> None:
+        self.created: list[list[str]] = []
+
+    def connection_stats(self) -> tuple[int, int]:
+        return 0, 0
+
+    async def create_task(
+        self, prompt: str, image_urls: list[str], callback_url: str | None = None
+    ) -> str:
+        self.created.append(image_urls)
+        return f"task-{len(self.created)}"
+
+
+class FakePoller:
+    def __init__(self, results: dict[str, KieTaskResult] | None = None) -> None:
+        self.results = results or {}
+
+    async def wait(self, task_id: str) -> KieTaskResult:
+        if task_id in self.results:
+            return self.results[task_id]
+        await asyncio.Event().wait()
+        raise AssertionError("unreachable")
+
+
+class FakeBot:
+    def __init__(self) -> None:
+        self.photos: list[str] = []
+        self.messages: list[str] = []
+        self.deleted: list[int] = []
+
+    async def send_photo(self, chat_id: int, photo, **kwargs) -> SimpleNamespace:
+        self.photos.append(photo)
+        return SimpleNamespace(document=None, photo=[SimpleNamespace(file_id="photo-file")])
+
+    async def send_message(self, chat_id: int, text: str, **kwargs) -> None:
+        self.messages.append(text)
+
+    async def delete_message(self, chat_id: int, message_id: int) -> None:
+        self.deleted.append(message_id)
+
+
+def _success(task_id: str) -> dict[str, KieTaskResult]:
+    return {task_id: KieTaskResult(status="success", image_urls=[f"https://cdn/{task_id}.png"])}
+
+
+def _service(
+    database,
+    poller: FakePoller,
+    kie_client: FakeKieClient | None = None,
+    job_repo: JobRepo | None = None,
+) -> tuple[GenerationService, BalanceService]:
+    balance_service = BalanceService(UserRepo(database), cache_ttl_seconds=0)
+    service = GenerationService(
+        kie_client or FakeKieClient(),
+        poller,
+        balance_service,
+        job_repo or JobRepo(database),
+        LockRepo(database),
+        workers=1,
+        queue_size=5,
+        lock_ttl_seconds=60,
+    )
+    return service, balance_service
+
+
+def _job(bot: FakeBot) -> GenerationJob:
+    return GenerationJob(
+        bot=bot,
+        user_id=USER_ID,
+        chat_id=CHAT_ID,
+        prompt="prompt",
+        photos=[InputPhoto("file-1", "unique-1")],
+        status_message_id=7,
+        input_urls=list(INPUT_URLS),
+    )
+
+
+async def _create_user(database, generations: int = 1) -> None:
+    await UserRepo(database).create_user(USER_ID, None, generations)
+
+
+async def _user(database) -> dict:
+    return await UserRepo(database).get_user(USER_ID)
+
+
+async def _wait_for_state(database, job_id: int, states: set[str]) -> dict:
+    job_repo = JobRepo(database)
+    for _ in range(200):
+        job = await job_repo.get_job(job_id)
+        if job["state"] in states:
+            return job
+        await asyncio.sleep(0.01)
+    raise AssertionError(f"job {job_id} stuck in {job['state']}")
+
+
+def test_recover_resumes_submitted_job(open_database) -> None:
+    async def scenario() -> None:
+        async with open_database() as database:
+            await _create_user(database)
+            job_repo = JobRepo(database)
+            job_id = await job_repo.create_job(USER_ID, CHAT_ID, "prompt", [{"file_id": "f"}])
+            await job_repo.update_state(job_id, "submitted", input_urls=INPUT_URLS, task_id="t-1")
+            kie_client = FakeKieClient()
+            service, balance_service = _service(database, FakePoller(_success("t-1")), kie_client)
+            assert await balance_service.reserve_generation(USER_ID)
+
+            bot = FakeBot()
+            assert await service.recover(bot) == 1
+            service.start()
+            job = await _wait_for_state(database, job_id, FINISHED_STATES)
+            await service.stop()
+
+            assert job["state"] == "done"
+            assert kie_client.created == []
+            assert bot.photos == ["https://cdn/t-1.png"]
+            user = await _user(database)
+            assert user["reserved_generations"] == 0
+            assert user["total_generations_used"] == 1
+
+    asyncio.run(scenario())
+
+
+class FailingResultJobRepo(JobRepo):
+    async def set_result(self, job_id: int, **fields) -> None:
+        if fields.get("photo_file_id"):
+            raise RuntimeError("disk full")
+        await super().set_result(job_id, **fields)
+
+
+class FakeStatusMessage:
+    message_id = 7
+
+    def __init__(self) -> None:
+        self.edits: list[str] = []
+
+    async def edit_text(self, text: str, reply_markup=None) -> None:
+        self.edits.append(text)
+
+
+class FakeMessage:
+    def __init__(self, bot: FakeBot) -> None:
+        self.bot = bot
+        self.from_user = SimpleNamespace(id=USER_ID)
+        self.chat = SimpleNamespace(id=CHAT_ID)
+        self.answers: list[str] = []
+        self.status_message = FakeStatusMessage()
+
+    async def answer(self, text: str, reply_markup=None) -> FakeStatusMessage:
+        self.answers.append(text)
+        return self.status_message
+
+
+async def _run_job(database, poller: FakePoller, **kwargs) -> tuple[dict, FakeBot]:
+    service, balance_service = _service(database, poller, **kwargs)
+    assert await balance_service.reserve_generation(USER_ID)
+    bot = FakeBot()
+    job = _job(bot)
+    service.start()
+    assert await service.enqueue(job) == 0
+    row = await _wait_for_state(database, job.job_id, FINISHED_STATES)
+    await service.stop()
+    return row, bot
+
+
+def test_delivered_job_commits_reserved_credit(open_database) -> None:
+    async def scenario() -> None:
+        async with open_database() as database:
+            await _create_user(database)
+            row, bot = await _run_job(database, FakePoller(_success("task-1")))
+            assert row["state"] == "done"
+            assert bot.photos == ["https://cdn/task-1.png"]
+            assert bot.deleted == [7]
+            user = await _user(database)
+            assert user["bonus_generations"] == 0
+            assert user["reserved_generations"] == 0
+            assert user["total_generations_used"] == 1
+
+    asyncio.run(scenario())
+
+
+def test_rejected_job_releases_reserved_credit(open_database) -> None:
+    async def scenario() -> None:
+        async with open_database() as database:
+            await _create_user(database)
+            rejected = {"task-1": KieTaskResult(status="failed", image_urls=[])}
+            row, bot = await _run_job(database, FakePoller(rejected))
+            assert row["state"] == "failed"
+            assert bot.photos == []
+            user = await _user(database)
+            assert user["bonus_generations"] == 1
+            assert user["reserved_generations"] == 0
+            assert user["total_generations_used"] == 0
+
+    asyncio.run(scenario())
+
+
+def test_error_after_delivery_still_commits(open_database) -> None:
+    async def scenario() -> None:
+        async with open_database() as database:
+            await _create_user(database)
+            row, bot = await _run_job(
+                database,
+                FakePoller(_success("task-1")),
+                job_repo=FailingResultJobRepo(database),
+            )
+            assert row["state"] == "done"
+            assert bot.photos == ["https://cdn/task-1.png"]
+            assert bot.messages == []
+            user = await _user(database)
+            assert user["reserved_generations"] == 0
+            assert user["total_generations_used"] == 1
+
+    asyncio.run(scenario())
+
+
+def test_recover_commits_job_stuck_in_delivering(open_database) -> None:
+    async def scenario() -> None:
+        async with open_database() as database:
+            await _create_user(database)
+            job_repo = JobRepo(database)
+            job_id = await job_repo.create_job(USER_ID, CHAT_ID, "prompt", [{"file_id": "f"}])
+            await job_repo.update_state(job_id, "delivering", input_urls=INPUT_URLS, task_id="t-1")
+            await job_repo.set_result(job_id, photo_file_id="photo-file")
+            service, balance_service = _service(database, FakePoller())
+            assert await balance_service.reserve_generation(USER_ID)
+
+            bot = FakeBot()
+            await service.recover(bot)
+
+            assert (await job_repo.get_job(job_id))["state"] == "done"
+            assert bot.photos == []
+            user = await _user(database)
+            assert user["reserved_generations"] == 0
+            assert user["total_generations_used"] == 1
+
+    asyncio.run(scenario())
+
+
+def test_second_enqueue_for_busy_user_is_refused(open_database) -> None:
+    async def scenario() -> None:
+        async with open_database() as database:
+            await _create_user(database, generations=2)
+            first, balance_service = _service(database, FakePoller())
+            other_worker, _ = _service(database, FakePoller())
+            assert await balance_service.reserve_generation(USER_ID)
+            assert await first.enqueue(_job(FakeBot())) == 0
+
+            for service in (first, other_worker):
+                try:
+                    await service.enqueue(_job(FakeBot()))
+                except GenerationBusyError:
+                    continue
+                raise AssertionError("busy user was enqueued twice")
+
+    asyncio.run(scenario())
+
+
+def test_handler_releases_credit_when_user_is_busy(open_database) -> None:
+    class BusyGenerationService:
+        async def is_busy(self, user_id: int) -> bool:
+            return False
+
+        async def enqueue(self, job: GenerationJob) -> int | None:
+            raise GenerationBusyError("busy")
+
+    async def scenario() -> None:
+        async with open_database() as database:
+            await _create_user(database)
+            ctx = SimpleNamespace(
+                balance_service=BalanceService(UserRepo(database), cache_ttl_seconds=0),
+                generation_service=BusyGenerationService(),
+            )
+            message = FakeMessage(FakeBot())
+            await _start_generation(message, ctx, "prompt", ["file-1"])
+
+            assert message.status_message.edits == [
+                "⏳ Генерация уже запущена. Дождитесь результата."
+            ]
+            user = await _user(database)
+            assert user["bonus_generations"] == 1
+            assert user["reserved_generations"] == 0
+
+    asyncio.run(scenario())
+
+
+def test_interrupted_job_keeps_lease_for_recovery(open_database) -> None:
+    async def scenario() -> None:
+        async with open_database() as database:
+            await _create_user(database)
+            service, balance_service = _service(database, FakePoller())
+            assert await balance_service.reserve_generation(USER_ID)
+            job = _job(FakeBot())
+            service.start()
+            await service.enqueue(job)
+            await _wait_for_state(database, job.job_id, {"submitted"})
+            await service.stop(timeout=0)
+
+            assert await LockRepo(database).is_locked(USER_ID)
+            restarted, _ = _service(database, FakePoller(_success("task-1")))
+            try:
+                await restarted.enqueue(_job(FakeBot()))
+            except GenerationBusyError:
+                pass
+            else:
+                raise AssertionError("duplicate generation enqueued during shutdown")
+            assert await restarted.recover(FakeBot()) == 1
+
+    asyncio.run(scenario())
@@ -0,0 +1,101 @@
+from __future__ import annotations
+
+import asyncio
+import time
+
+from app.services.kie_client import KieTaskResult
+from app.services.kie_task_poller import KieTaskPoller
+
+
+class FakeKieClient:
+    def __init__(self, delays: dict[str, float]) -> None:
+        self._delays = delays
+        self.active: dict[str, int] = {}
+        self.max_active: dict[str, int] = {}
+
+    async def get_task(self, task_id: str) -> dict:
+        self.active[task_id] = self.active.get(task_id, 0) + 1
+        self.max_active[task_id] = max(self.max_active.get(task_id, 0), self.active[task_id])
+        try:
+            await asyncio.sleep(self._delays.get(task_id, 0))
+        finally:
+            self.active[task_id] -= 1
+        return {"data": {"taskId": task_id, "state": "success"}}
+
+    def parse_task(self, data: dict) -> KieTaskResult | None:
+        task_data = data["data"]
+        if task_data.get("state") != "success":
+            return None
+        return KieTaskResult(status="success", image_urls=[f"https://cdn/{task_data['taskId']}"])
+
+
+def _poller(client: FakeKieClient) -> KieTaskPoller:
+    return KieTaskPoller(
+        client,
+        min_interval_seconds=0.01,
+        max_interval_seconds=0.01,
+        max_wait_seconds=10,
+        jitter=0,
+    )
+
+
+def test_slow_check_does_not_block_other_tasks() -> None:
+    async def scenario() -> float:
+        poller = _poller(FakeKieClient({"slow": 1.0}))
+        runner = asyncio.create_task(poller.run())
+        slow = asyncio.create_task(poller.wait("slow"))
+        await asyncio.sleep(0.05)
+        started = time.perf_counter()
+        result = await asyncio.wait_for(poller.wait("fast"), timeout=0.5)
+        elapsed = time.perf_counter() - started
+        assert result.image_urls == ["https://cdn/fast"]
+        assert (await slow).image_urls == ["https://cdn/slow"]
+        runner.cancel()
+        return elapsed
+
+    assert asyncio.run(scenario()) < 0.5
+
+
+def test_task_is_not_polled_twice_at_once() -> None:
+    async def scenario() -> None:
+        client = FakeKieClient({"slow": 0.2})
+        poller = _poller(client)
+        runner = asyncio.create_task(poller.run())
+        await poller.wait("slow")
+        runner.cancel()
+        assert client.max_active["slow"] == 1
+
+    asyncio.run(scenario())
+
+
+def test_cancelled_waiter_keeps_task_for_other_waiters() -> None:
+    async def scenario() -> None:
+        poller = _poller(FakeKieClient({"task": 0.2}))
+        runner = asyncio.create_task(poller.run())
+        first = asyncio.create_task(poller.wait("task"))
+        second = asyncio.create_task(poller.wait("task"))
+        await asyncio.sleep(0.05)
+        first.cancel()
+        result = await asyncio.wait_for(second, timeout=1)
+        runner.cancel()
+        assert result.image_urls == ["https://cdn/task"]
+        assert poller.in_flight == 0
+
+    asyncio.run(scenario())
+
+
+def test_callback_resolves_registered_task() -> None:
+    async def scenario() -> None:
+        poller = KieTaskPoller(
+            FakeKieClient({}),
+            min_interval_seconds=60,
+            max_interval_seconds=60,
+            max_wait_seconds=120,
+        )
+        waiter = asyncio.create_task(poller.wait("task"))
+        await asyncio.sleep(0)
+        resolved = await poller.resolve({"data": {"taskId": "task", "state": "success"}})
+        assert resolved
+        assert (await waiter).image_urls == ["https://cdn/task"]
+
+    asyncio.run(scenario())
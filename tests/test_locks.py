@@ -0,0 +1,44 @@
+from __future__ import annotations
+
+import asyncio
+
+from app.repositories.locks import LockRepo
+
+
+def test_lease_blocks_second_owner(open_database) -> None:
+    async def scenario() -> None:
+        async with open_database() as database:
+            locks = LockRepo(database)
+            assert await locks.acquire(1, "worker-a", ttl_seconds=60)
+            assert not await locks.acquire(1, "worker-b", ttl_seconds=60)
+            assert await locks.is_locked(1)
+            await locks.release(1, "worker-b")
+            assert await locks.is_locked(1)
+            await locks.release(1, "worker-a")
+            assert await locks.acquire(1, "worker-b", ttl_seconds=60)
+
+    asyncio.run(scenario())
+
+
+def test_expired_lease_can_be_taken_over(open_database) -> None:
+    async def scenario() -> None:
+        async with open_database() as database:
+            locks = LockRepo(database)
+            assert await locks.acquire(1, "worker-a", ttl_seconds=-1)
+            assert not await locks.is_locked(1)
+            assert await locks.acquire(1, "worker-b", ttl_seconds=60)
+            assert await locks.extend("worker-a", ttl_seconds=60) == 0
+
+    asyncio.run(scenario())
+
+
+def test_recovery_forces_live_lease(open_database) -> None:
+    async def scenario() -> None:
+        async with open_database() as database:
+            locks = LockRepo(database)
+            assert await locks.acquire(1, "old-process", ttl_seconds=60)
+            assert await locks.acquire(1, "new-process", ttl_seconds=60, force=True)
+            await locks.release(1, "old-process")
+            assert not await locks.acquire(1, "other", ttl_seconds=60)
+
+    asyncio.run(scenario())
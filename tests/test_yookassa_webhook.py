@@ -0,0 +1,49 @@
+from __future__ import annotations
+
+import asyncio
+from types import SimpleNamespace
+
+from aiohttp import web
+from aiohttp.test_utils import TestClient, TestServer
+
+from app.web.yookassa import yookassa_webhook_handler
+
+
+class FakePaymentRepo:
+    def __init__(self) -> None:
+        self.lookups: list[str] = []
+
+    async def get_payment(self, payment_id: str) -> dict | None:
+        self.lookups.append(payment_id)
+        return None
+
+
+async def _post(payload: str) -> tuple[int, FakePaymentRepo]:
+    payment_repo = FakePaymentRepo()
+    ctx = SimpleNamespace(payment_repo=payment_repo)
+    app = web.Application()
+    app.router.add_post("/yookassa", yookassa_webhook_handler(ctx, bot=None))
+    async with TestClient(TestServer(app)) as client:
+        resp = await client.post(
+            "/yookassa", data=payload, headers={"Content-Type": "application/json"}
+        )
+        return resp.status, payment_repo
+
+
+def test_rejects_bodies_that_are_not_objects() -> None:
+    for payload in ('["payment.succeeded"]', '"payment.succeeded"', "42", "null"):
+        status, payment_repo = asyncio.run(_post(payload))
+        assert status == 400, payload
+        assert payment_repo.lookups == []
+
+
+def test_rejects_invalid_json() -> None:
+    status, _ = asyncio.run(_post("{not json"))
+    assert status == 400
+
+
+def test_accepts_notification_for_unknown_payment() -> None:
+    payload = '{"event": "payment.succeeded", "object": {"id": "pay-1"}}'
+    status, payment_repo = asyncio.run(_post(payload))
+    assert status == 200
+    assert payment_repo.lookups == ["pay-1"]